@@ -4,73 +4,156 @@ Tool for manually annotating the four corners of a chessboard in an image.
 User clicks on the presented image in the order (From perspective of image):
 Top-Left, Top-Right, Bottom-Right, Bottom-Left
 Saves the corner coordinates to a JSON file for later use in warping.
+The photo is decoded at a reduced JPEG scale just big enough for the display (decode.py);
+clicks are mapped back so the saved corners are full-resolution image pixels.
+Earlier versions saved 0.7x display pixels; --upgrade-legacy <dir> rescales such files once.
+Folder mode decodes the next --prefetch images in a background thread, pre-places the previous
+image's corners as a guess ([s] keeps them), and reports seconds per image for the session.
+The window is only redrawn after a click or key press.
 """
 
-import argparse, json, cv2, numpy as np
+import argparse, json, time, cv2, numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from .warp import order_corners
+from .warp import save_corners
+from .decode import decode, image_size, factor_for_display
+from .profiling import stage, count, add_profile_args, start_profiling, finish_profiling
 
 HELP = "Click 4 corners: TL, TR, BR, BL. [s]=save, [r]=reset, [f]=flip, [q]=quit"
+DISPLAY_SIDE = 1800  # long side of the displayed image (window is resizable)
+LEGACY_SCALE = 0.7  # display scale older versions saved corners at
+GUESS_COLOR = (0, 255, 255)  # pre-placed corners of the previous image
+POINT_COLOR = (0, 0, 255)
 
 def on_mouse(event, x, y, flags, param):
-    pts = param["pts"]
     if event == cv2.EVENT_LBUTTONDOWN:
-        pts.append((x, y))
+        # a click on a pre-placed guess starts over
+        if param["guess"]:
+            param["pts"].clear()
+            param["guess"] = False
+        param["pts"].append((x, y))
+        param["dirty"] = True
 
-def annotate_image(img_path: Path, out_path: Path):
-    img = cv2.imread(str(img_path))
+# Decode + downscale one photo for display -> (img, scale, (full_w, full_h)), img None if unreadable
+# scale (display / full image) maps clicks back to full resolution
+def load_display(img_path):
+    with stage("imread"):
+        try:
+            full_w, full_h = image_size(img_path)
+            img = decode(img_path, factor_for_display(img_path, DISPLAY_SIDE))
+        except OSError:
+            img = None
+        if img is None:
+            return None, None, None
+        if max(img.shape[:2]) > DISPLAY_SIDE:
+            f = DISPLAY_SIDE / max(img.shape[:2])
+            img = cv2.resize(img, (round(img.shape[1] * f), round(img.shape[0] * f)), interpolation=cv2.INTER_AREA)
+    return img, img.shape[1] / full_w, (full_w, full_h)
+
+# `loaded`: load_display result (e.g. prefetched); `guess`: corners to pre-place, as fractions
+# of the image width/height
+def annotate_image(img_path: Path, out_path: Path, loaded=None, guess=None):
+    img, scale, full_size = loaded if loaded is not None else load_display(img_path)
     if img is None:
         print(f"⚠️ Could not read {img_path}")
         return False
-
-    # Resize for display
-    scale = 0.7
-    h, w = img.shape[:2]
-    img = cv2.resize(img, (int(w * scale), int(h * scale)))
+    count("images")
 
     pts = []
+    if guess is not None:
+        pts = [(int(round(x)), int(round(y))) for x, y in np.asarray(guess) * np.array(full_size) * scale]
+        print("Previous corners pre-placed (yellow): [s] keeps them, a click starts over.")
+    with stage("annotate"):
+        return _annotate_loop(img, out_path, scale, pts)
+
+# Interactive click/key loop on the (display sized) image
+# the frame is only redrawn after a click or key press
+def _annotate_loop(img, out_path, scale=1.0, guess=None):
+    state = {"pts": list(guess or []), "guess": bool(guess), "dirty": True}
+    pts = state["pts"]
     flip_preview = False
+    base = None  # image (flipped for preview) with the help text, drawn once
     cv2.namedWindow("corners", cv2.WINDOW_NORMAL)
-    cv2.setMouseCallback("corners", on_mouse, {"pts": pts})
+    cv2.setMouseCallback("corners", on_mouse, state)
 
     while True:
-        vis = img.copy()
-        if flip_preview:
-            vis = vis[::-1, ::-1]
-
-        cv2.putText(vis, HELP, (20, 40),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,255,0), 3, cv2.LINE_AA)
-        for i, p in enumerate(pts):
-            cv2.circle(vis, p, 6, (0,0,255), -1)
-            cv2.putText(vis, str(i+1), (p[0]+8, p[1]-8),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,0,255), 2, cv2.LINE_AA)
-
-        cv2.imshow("corners", vis)
+        if state["dirty"]:
+            if base is None:
+                base = np.ascontiguousarray(img[::-1, ::-1]) if flip_preview else img.copy()
+                cv2.putText(base, HELP, (20, 40),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,255,0), 3, cv2.LINE_AA)
+            vis = base.copy()
+            color = GUESS_COLOR if state["guess"] else POINT_COLOR
+            if state["guess"] and len(pts) == 4:
+                cv2.polylines(vis, [np.array(pts, dtype=np.int32)], True, color, 2, cv2.LINE_AA)
+            for i, p in enumerate(pts):
+                cv2.circle(vis, p, 6, color, -1)
+                cv2.putText(vis, str(i+1), (p[0]+8, p[1]-8),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1.0, color, 2, cv2.LINE_AA)
+            cv2.imshow("corners", vis)
+            state["dirty"] = False
+
         k = cv2.waitKey(20) & 0xFF
         if k == ord('q'):
             return "quit"
         elif k == ord('r'):
             pts.clear()
+            state["guess"] = False
+            state["dirty"] = True
         elif k == ord('f'):
             flip_preview = not flip_preview
+            base = None
+            state["dirty"] = True
         elif k == ord('s'):
             if len(pts) != 4:
                 print("Need exactly 4 points.")
                 continue
-            ordered = order_corners(pts)
-            out_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(out_path, "w") as f:
-                json.dump(ordered.tolist(), f, indent=2)
+            with stage("save"):
+                save_corners(pts, out_path, scale)
             print(f"✅ Saved corners to {out_path}")
             return True
 
+# Rescale every corner JSON under `root` (one board or several, see infer_image.load_boards)
+# from legacy 0.7x display pixels to full resolution. Not idempotent: run once per folder.
+def upgrade_legacy(root, scale=LEGACY_SCALE):
+    paths = sorted(Path(root).rglob("*.json"))
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = {k: np.round(np.array(v, dtype=np.float64) / scale, 2).tolist() for k, v in data.items()}
+        else:
+            data = np.round(np.array(data, dtype=np.float64) / scale, 2).tolist()
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+    return len(paths)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--folder", type=str, help="Folder containing input images")
     ap.add_argument("--image", type=str, help="Single image path (optional)")
-    ap.add_argument("--out", required=True, type=str, help="Output folder or file")
+    ap.add_argument("--out", type=str, help="Output folder or file")
+    ap.add_argument("--prefetch", type=int, default=2, help="Folder mode: images decoded ahead in the background")
+    ap.add_argument("--upgrade-legacy", type=str, metavar="DIR",
+                    help="Rescale corner JSONs saved by older versions (0.7x display pixels) to full resolution, once")
+    ap.add_argument("--no-guess", action="store_true",
+                    help="Folder mode: don't pre-place the previous image's corners")
+    add_profile_args(ap)
     args = ap.parse_args()
 
+    start_profiling(args)
+    try:
+        run(args)
+    finally:
+        finish_profiling(args)
+
+def run(args):
+    if args.upgrade_legacy:
+        n = upgrade_legacy(args.upgrade_legacy)
+        print(f"✅ Rescaled {n} corner files in {args.upgrade_legacy} to full resolution")
+        return
+    if not args.out:
+        raise SystemExit("Provide --out")
     if args.folder:
         img_paths = sorted(
             [p for p in Path(args.folder).iterdir()
@@ -81,13 +164,36 @@ def main():
         out_dir = Path(args.out)
         out_dir.mkdir(parents=True, exist_ok=True)
 
-        for img_path in img_paths:
+        # decode + downscale the next --prefetch images while the current one is annotated
+        pool = ThreadPoolExecutor(max_workers=1)
+        ahead = max(0, args.prefetch)
+        futures = {i: pool.submit(load_display, p) for i, p in enumerate(img_paths[:ahead])}
+        guess = None
+        saved, wait_s, t_session = 0, 0.0, time.perf_counter()
+        for i, img_path in enumerate(img_paths):
+            # keeps images i+1 .. i+ahead loading while image i is on screen (ahead=0: load it now)
+            if i + ahead < len(img_paths):
+                futures[i + ahead] = pool.submit(load_display, img_paths[i + ahead])
             out_path = out_dir / f"{img_path.stem}.json"
             print(f"\n=== {img_path.name} ===")
-            result = annotate_image(img_path, out_path)
+            t0 = time.perf_counter()
+            loaded = futures.pop(i).result()
+            wait_s += time.perf_counter() - t0
+            result = annotate_image(img_path, out_path, loaded, None if args.no_guess else guess)
             if result == "quit":
                 break
+            if result is True:
+                saved += 1
+                # same camera, same board: the next photo starts from these corners (relative to image size)
+                with open(out_path) as f:
+                    guess = np.array(json.load(f), dtype=np.float32) / np.array(loaded[2])
+                print(f"{time.perf_counter() - t0:.1f}s for this image")
+        pool.shutdown(wait=False, cancel_futures=True)
 
+        elapsed = time.perf_counter() - t_session
+        if saved:
+            print(f"{saved} images in {elapsed:.1f}s: {elapsed / saved:.1f}s per image "
+                  f"({wait_s:.1f}s waiting for images to load)")
         cv2.destroyAllWindows()
         print("All done ✅")
     elif args.image:
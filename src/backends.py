@@ -0,0 +1,129 @@
+"""
+backends.py
+Inference backends for the square classifier, picked by model file extension:
+    .keras / .h5  -> Keras (TensorFlow)
+    .tflite       -> TFLite (ai_edge_litert / tflite_runtime if installed, else TensorFlow's interpreter)
+    .onnx         -> ONNX Runtime
+Each backend imports only its own runtime, and only when a model is loaded, so a TFLite or
+ONNX model never pays for the TensorFlow import.
+All backends take a float32 (N, img_size, img_size, C) batch scaled to [0, 1] and return
+(N, num_classes) probabilities. `input_shape` is the model's (h, w, channels); crops of another
+size are resized to it and colour crops averaged to one channel for grayscale models
+(fit_input), so compact train_classifier variants work with every inference tool. Class order comes from <model>.classes.json (saved by
+train_classifier.py), falling back to fen_utils.LABELS.
+`threads` sets the runtime's intra-op threads; `inter_threads` its inter-op threads
+(defaults to `threads`; TFLite has no inter-op pool and ignores it).
+"""
+
+import json, numpy as np, cv2
+from pathlib import Path
+from .fen_utils import LABELS
+
+GRAY_AVERAGE = np.full((1, 3), 1.0 / 3.0, dtype=np.float32)
+
+# Resize a (N, h, w, C) crop batch to the model's (h, w, channels), averaging colour to gray
+# for one-channel models; no-op when it matches. Same result as train_classifier's variants
+# (channel mean + tf.image.resize "area"): the crops are stacked into one (N*h, w) image and
+# resized in a single INTER_AREA call (crop borders land on output pixel borders, so crops
+# don't blend), gray first so only one channel is resized
+def fit_input(batch, input_shape):
+    h, w, channels = (int(d) for d in input_shape[-3:])
+    n = len(batch)
+    if batch.shape[1:3] == (h, w) and (channels != 1 or batch.shape[-1] == 1):
+        return batch
+    flat = np.ascontiguousarray(batch, dtype=np.float32).reshape(n * batch.shape[1], batch.shape[2], -1)
+    if channels == 1 and flat.shape[-1] != 1:
+        flat = cv2.transform(flat, GRAY_AVERAGE)
+    if batch.shape[1:3] != (h, w):
+        flat = cv2.resize(flat, (w, n * h), interpolation=cv2.INTER_AREA)
+    return flat.reshape(n, h, w, -1)
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model_path, threads=None, inter_threads=None):
+        import tensorflow as tf
+        if threads:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+        if inter_threads or threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_threads or threads)
+        self.model = tf.keras.models.load_model(model_path)
+        self.input_shape = tuple(self.model.input_shape[1:])
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict_on_batch(fit_input(batch, self.input_shape)))
+
+class TFLiteBackend:
+    name = "tflite"
+
+    def __init__(self, model_path, threads=None, inter_threads=None):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+        self.interp = Interpreter(model_path=str(model_path), num_threads=threads)
+        self.interp.allocate_tensors()
+        self.inp = self.interp.get_input_details()[0]
+        self.out = self.interp.get_output_details()[0]
+        self.input_shape = tuple(int(d) for d in self.inp["shape"][1:])
+        self.batch = int(self.inp["shape"][0])
+
+    def predict(self, batch):
+        batch = fit_input(batch, self.input_shape)
+        # the interpreter is compiled for one batch size; resize when it changes
+        if len(batch) != self.batch:
+            self.interp.resize_tensor_input(self.inp["index"], [len(batch), *self.input_shape])
+            self.interp.allocate_tensors()
+            self.inp = self.interp.get_input_details()[0]
+            self.out = self.interp.get_output_details()[0]
+            self.batch = len(batch)
+        x = batch
+        # int8 models with quantized I/O take/return int8 with a scale + zero point
+        if self.inp["dtype"] != np.float32:
+            scale, zero = self.inp["quantization"]
+            x = np.clip(np.round(batch / scale + zero), -128, 127).astype(self.inp["dtype"])
+        self.interp.set_tensor(self.inp["index"], x)
+        self.interp.invoke()
+        y = self.interp.get_tensor(self.out["index"])
+        if self.out["dtype"] != np.float32:
+            scale, zero = self.out["quantization"]
+            y = (y.astype(np.float32) - zero) * scale
+        return y
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_path, threads=None, inter_threads=None):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+        if inter_threads or threads:
+            opts.inter_op_num_threads = inter_threads or threads
+        self.session = ort.InferenceSession(str(model_path), sess_options=opts,
+                                            providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        self.input_shape = tuple(inp.shape[1:])
+
+    def predict(self, batch):
+        batch = fit_input(batch, self.input_shape)
+        return self.session.run(None, {self.input_name: batch.astype(np.float32)})[0]
+
+BACKENDS = {".keras": KerasBackend, ".h5": KerasBackend, ".tflite": TFLiteBackend, ".onnx": OnnxBackend}
+
+def load_backend(model_path, threads=None, inter_threads=None):
+    suffix = Path(model_path).suffix.lower()
+    if suffix not in BACKENDS:
+        raise ValueError(f"Unknown model format {suffix!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[suffix](model_path, threads=threads, inter_threads=inter_threads)
+
+def load_class_names(model_path):
+    classes_path = Path(model_path).with_suffix(".classes.json")
+    if classes_path.exists():
+        return json.load(open(classes_path))
+    return LABELS
@@ -0,0 +1,179 @@
+"""
+benchmark.py
+Stage-level benchmark over the bundled corpus: every input_imgs/<n>/ photo with corners in data/corners/<n>/.
+Times each pipeline stage in isolation on real inputs, then the end-to-end path used by infer_image:
+    imread, warp_board, maybe_flip_180, split_squares, resize (64 crops), warp_squares,
+    warp_squares_new, maybe_flip_squares, predict (64-crop batch), grid_to_fen_placement, end_to_end
+warp_squares repeats the same corners (fixed camera: cached remap grid after the first call);
+warp_squares_new jitters them on every call, like batch inference over different photos.
+end_to_end decodes with decode_for_boards (reduced JPEG scale), as infer_image does.
+The classifier is a randomly initialized build_small_cnn by default (no trained weights needed);
+--model benchmarks a real model through backends.py instead.
+Reports p50/p90/p99 latency, throughput and peak traced memory per stage, saves JSON (--out),
+and compares against a stored baseline JSON (--baseline), flagging stages whose p50 regressed
+by more than --tolerance. Exits non-zero on regression.
+"""
+
+import argparse, json, platform, time, tracemalloc, numpy as np, cv2
+from pathlib import Path
+from .warp import warp_board, warp_squares
+from .squares import maybe_flip_180, split_squares, maybe_flip_squares
+from .fen_utils import LABELS, grid_to_fen_placement
+from .build_all import discover_jobs
+from .infer_image import load_corners
+from .decode import decode_for_boards
+
+def summarize(samples, peak_bytes):
+    ms = np.array(samples) * 1000.0
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "throughput_per_s": round(1000.0 / float(ms.mean()), 2),
+        "peak_mem_mb": round(peak_bytes / 1e6, 2),
+    }
+
+class StageTimer:
+    # Collects per-call latencies per stage, plus peak traced memory from one extra traced call
+    def __init__(self, repeats):
+        self.repeats = repeats
+        self.samples = {}
+        self.peaks = {}
+
+    def run(self, name, fn, *args):
+        times = self.samples.setdefault(name, [])
+        for _ in range(self.repeats):
+            t0 = time.perf_counter()
+            out = fn(*args)
+            times.append(time.perf_counter() - t0)
+        # memory pass kept separate so tracing doesn't skew the timings
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        fn(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.peaks[name] = max(self.peaks.get(name, 0), peak)
+        return out
+
+    def results(self):
+        return {name: summarize(s, self.peaks.get(name, 0)) for name, s in self.samples.items()}
+
+def make_predict(args):
+    if args.model:
+        from .backends import load_backend
+        model = load_backend(args.model)
+        return model.predict, args.model
+    from .train_classifier import build_small_cnn
+    model = build_small_cnn(num_classes=len(LABELS), input_size=args.img_size)
+    return (lambda batch: np.asarray(model.predict_on_batch(batch))), "random build_small_cnn"
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\n{'stage':<20} {'base p50':>10} {'now p50':>10} {'change':>8}")
+    for name, now in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        change = now["p50_ms"] / max(base["p50_ms"], 1e-9) - 1.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  ⚠️ REGRESSION"
+        print(f"{name:<20} {base['p50_ms']:10.2f} {now['p50_ms']:10.2f} {100 * change:+7.1f}%{flag}")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--positions", type=str, default="input_imgs")
+    ap.add_argument("--corners", type=str, default="data/corners")
+    ap.add_argument("--model", type=str, help="Benchmark this model instead of a random build_small_cnn")
+    ap.add_argument("--img-size", type=int, default=96)
+    ap.add_argument("--repeats", type=int, default=3, help="Timed calls per stage per image")
+    ap.add_argument("--limit", type=int, help="Only use the first N images")
+    ap.add_argument("--out", type=str, default="bench_results.json")
+    ap.add_argument("--baseline", type=str, help="Baseline JSON (a previous --out) to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before flagging")
+    args = ap.parse_args()
+
+    jobs = discover_jobs(args.positions, args.corners)[:args.limit]
+    if not jobs:
+        raise SystemExit("No images with corners found.")
+    predict, model_desc = make_predict(args)
+    size = (args.img_size, args.img_size)
+    predict(np.zeros((64, *size, 3), dtype=np.float32))  # warm-up / graph tracing
+
+    timer = StageTimer(args.repeats)
+    rng = np.random.default_rng(0)
+    e2e = []
+    e2e_peak = 0
+    for img_path, corners_path, _ in jobs:
+        corners = load_corners(corners_path)
+        img = timer.run("imread", cv2.imread, str(img_path))
+        topdown, _ = timer.run("warp_board", warp_board, img, corners, 800)
+        topdown = timer.run("maybe_flip_180", maybe_flip_180, topdown)
+        crops = timer.run("split_squares", split_squares, topdown, 2)
+        timer.run("resize", lambda cs: [cv2.resize(c, size) for c in cs], crops)
+        squares = timer.run("warp_squares", warp_squares, img, corners, args.img_size)
+        timer.run("warp_squares_new",
+                  lambda: warp_squares(img, corners + rng.uniform(-1, 1, (4, 2)), args.img_size))
+        squares = timer.run("maybe_flip_squares", maybe_flip_squares, squares)
+        batch = squares.astype(np.float32) / 255.0
+        probs = timer.run("predict", predict, batch)
+        labels = [LABELS[i] for i in probs.argmax(axis=1)]
+        timer.run("grid_to_fen", grid_to_fen_placement, labels)
+        del img, topdown, crops
+
+        # end to end, as infer_image does it: reduced decode -> warp_squares -> flip -> predict -> FEN
+        def end_to_end():
+            c = load_corners(corners_path)
+            im, scale = decode_for_boards(img_path, [c], args.img_size)
+            sq = maybe_flip_squares(warp_squares(im, c * scale, args.img_size))
+            p = predict(sq.astype(np.float32) / 255.0)
+            return grid_to_fen_placement([LABELS[i] for i in p.argmax(axis=1)])
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            end_to_end()
+            e2e.append(time.perf_counter() - t0)
+        tracemalloc.start()
+        end_to_end()
+        e2e_peak = max(e2e_peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        print(f"benchmarked {img_path}")
+
+    stages = timer.results()
+    stages["end_to_end"] = summarize(e2e, e2e_peak)
+    try:
+        import resource
+        max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    except ImportError:  # Windows
+        max_rss_mb = None
+    results = {
+        "meta": {"images": len(jobs), "repeats": args.repeats, "img_size": args.img_size, "model": model_desc,
+                 "python": platform.python_version(), "opencv": cv2.__version__, "machine": platform.machine(),
+                 "max_rss_mb": max_rss_mb, "time": time.strftime("%Y-%m-%d %H:%M:%S")},
+        "stages": stages,
+    }
+
+    print(f"\n{len(jobs)} images x {args.repeats} repeats, model: {model_desc}")
+    print(f"{'stage':<20} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'per s':>9} {'peak MB':>9}")
+    for name, r in stages.items():
+        print(f"{name:<20} {r['p50_ms']:9.2f} {r['p90_ms']:9.2f} {r['p99_ms']:9.2f} "
+              f"{r['throughput_per_s']:9.1f} {r['peak_mem_mb']:9.1f}")
+    if max_rss_mb:
+        print(f"process peak RSS: {max_rss_mb:.0f} MB")
+
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {args.out}")
+
+    if args.baseline:
+        regressions = compare(results, json.load(open(args.baseline)), args.tolerance)
+        if regressions:
+            raise SystemExit(f"Regressed stages: {', '.join(regressions)}")
+        print("✅ No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
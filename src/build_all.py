@@ -0,0 +1,127 @@
+"""
+build_all.py
+Build the whole dataset in one go (cross-platform replacement for the build_all.cmd loop).
+Discovers every <positions>/<n>/fen_list.csv with its <corners>/<n>/ folder, fans the images
+out across a process pool (one build_dataset.process_one per image), and inside each worker
+overlaps the 64 PNG encodes/writes with a thread pool. Prints a throughput summary.
+With --format npy the workers hand their crops back and the parent packs them into shards.
+With --catalog, PNG builds only process new or changed images (see catalog.py); packed builds
+always repack everything and record it.
+"""
+
+import argparse, os, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from .build_dataset import (process_one, crops_for_image, read_fen_file, collect_jobs,
+                            incremental_check, record_build)
+from .packed import ShardWriter
+from .catalog import Catalog
+
+# per-process PNG writer pool, created once by the pool initializer
+_writer = None
+
+def _init_worker(write_threads):
+    global _writer
+    _writer = ThreadPoolExecutor(max_workers=write_threads)
+
+def _build_one(job, out_root, img_size, reduce=True):
+    img_path, corners_path, fen_str = job
+    t0 = time.perf_counter()
+    n = process_one(img_path, corners_path, fen_str, out_root, img_size=img_size, writer=_writer, reduce=reduce)
+    return n, time.perf_counter() - t0, None
+
+# packed mode: workers return the crops and the parent appends them to the shards
+def _pack_one(job, img_size, reduce=True):
+    img_path, corners_path, fen_str = job
+    t0 = time.perf_counter()
+    result = crops_for_image(img_path, corners_path, fen_str, img_size, reduce)
+    if result is None:
+        return 0, time.perf_counter() - t0, None
+    return len(result[0]), time.perf_counter() - t0, (Path(img_path).stem, *result)
+
+# Every (image, corners, FEN) job under positions/<n>/ that has a fen_list.csv and corners/<n>/
+def discover_jobs(positions, corners_root):
+    jobs = []
+    for folder in sorted(Path(positions).iterdir()):
+        if not folder.is_dir():
+            continue
+        fen_file = folder / "fen_list.csv"
+        corners_dir = Path(corners_root) / folder.name
+        if not fen_file.exists():
+            print(f"Skipping {folder} (no fen_list.csv found)")
+            continue
+        if not corners_dir.is_dir():
+            print(f"Skipping {folder} (no corners folder {corners_dir})")
+            continue
+        folder_jobs = collect_jobs(folder, corners_dir, read_fen_file(fen_file))
+        print(f"Folder {folder.name}: {len(folder_jobs)} images")
+        jobs.extend(folder_jobs)
+    return jobs
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--positions", type=str, default="input_imgs", help="Folder of <n>/ position folders")
+    ap.add_argument("--corners", type=str, default=os.path.join("data", "corners"), help="Folder of <n>/ corner folders")
+    ap.add_argument("--dataset-root", type=str, default=os.path.join("data", "dataset"))
+    ap.add_argument("--img-size", type=int, default=96)
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="Image worker processes")
+    ap.add_argument("--write-threads", type=int, default=4, help="PNG writer threads per worker")
+    ap.add_argument("--format", choices=["png", "npy"], default="png",
+                    help="png: one file per crop under raw/<label>/; npy: memmappable shards under packed/")
+    ap.add_argument("--full-decode", action="store_true", help="Always decode photos at full resolution")
+    ap.add_argument("--catalog", type=str, help="SQLite catalog (catalog.py): only rebuild new or changed images")
+    args = ap.parse_args()
+
+    jobs = discover_jobs(args.positions, args.corners)
+    if not jobs:
+        raise SystemExit("No images with FEN and corners found.")
+    total_jobs = len(jobs)
+    catalog = Catalog(args.catalog) if args.catalog else None
+    keys = {}
+    if catalog:
+        keys = {job[0]: catalog.build_key(job[0], job[1], job[2], args.img_size) for job in jobs}
+        if args.format == "png":
+            jobs = [job for job in jobs
+                    if incremental_check(catalog, job[0], args.dataset_root, args.format, keys[job[0]])]
+            print(f"{total_jobs - len(jobs)} images up to date, {len(jobs)} to build")
+    out_root = Path(args.dataset_root) / "raw"
+    # a full build starts the packed shards from scratch
+    shard_writer = ShardWriter(Path(args.dataset_root) / "packed", args.img_size, append=False) \
+        if args.format == "npy" else None
+
+    t_start = time.perf_counter()
+    images, crops, busy = 0, 0, 0.0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.write_threads,)) as pool:
+        if shard_writer:
+            futures = {pool.submit(_pack_one, job, args.img_size, not args.full_decode): job for job in jobs}
+        else:
+            futures = {pool.submit(_build_one, job, out_root, args.img_size, not args.full_decode): job
+                       for job in jobs}
+        # shards are appended in job (discover_jobs) order, so global crop indices (and the seeded
+        # split / dedupe manifests built on them) are the same on every build; PNGs can land in any order
+        for fut in (futures if shard_writer else as_completed(futures)):
+            n, seconds, packed = fut.result()
+            if n:
+                images += 1
+                crops += n
+                busy += seconds
+                if catalog:
+                    img_path = futures[fut][0]
+                    record_build(catalog, img_path, args.dataset_root, args.format, keys[img_path])
+            if packed:
+                source, image_crops, labels = packed
+                shard_writer.add(image_crops, labels, source)
+    if shard_writer:
+        shard_writer.close()
+    elapsed = time.perf_counter() - t_start
+
+    if catalog:
+        print(catalog.summary())
+        catalog.close()
+    print(f"\n✅ Dataset build complete: {images}/{len(jobs)} images, {crops} crops in {elapsed:.2f}s")
+    print(f"throughput: {images / elapsed:.1f} images/s, {crops / elapsed:.0f} crops/s "
+          f"({args.workers} workers, {busy / max(images, 1) * 1000:.0f} ms/image per worker)")
+
+if __name__ == "__main__":
+    main()
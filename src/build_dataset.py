@@ -1,8 +1,12 @@
 import argparse, json, os, cv2, numpy as np
 from pathlib import Path
-from .warp import warp_board
-from .squares import split_squares, maybe_flip_180
+from .warp import warp_squares
+from .squares import maybe_flip_squares
 from .fen_utils import LABELS
+from .packed import ShardWriter
+from .decode import decode_for_boards
+from .catalog import Catalog
+from .profiling import stage, count, add_profile_args, start_profiling, finish_profiling
 
 FEN_TO_LABEL = {
     'K':'white_king','Q':'white_queen','R':'white_rook','B':'white_bishop','N':'white_knight','P':'white_pawn',
@@ -24,26 +28,117 @@ def parse_fen_placement(placement):
         raise ValueError("Decoded labels != 64")
     return labels
 
-def process_one(image_path, corners_path, fen_str, out_root, img_size=96):
-    img = cv2.imread(str(image_path))
+# Warp one photo into its 64 oriented crops + their labels (None if the image can't be read)
+# reduce: decode the JPEG at the smallest resolution that still covers img_size crops (decode.py)
+def crops_for_image(image_path, corners_path, fen_str, img_size=96, reduce=True):
+    corners = np.array(json.load(open(corners_path)), dtype=np.float32)
+    with stage("imread"):
+        img, scale = decode_for_boards(image_path, [corners], img_size=img_size, pad=2, reduce=reduce)
     if img is None:
         print(f"⚠️ Could not read image {image_path}")
-        return
-    corners = np.array(json.load(open(corners_path)), dtype=np.float32)
-    topdown, _ = warp_board(img, corners, out_size=800)
-    topdown = maybe_flip_180(topdown)  # ensure A1 is dark in bottom-left to match FEN order
-    crops = split_squares(topdown, pad=2)
+        return None
+    # sample the 64 img_size crops straight from the photo (no 800x800 warp + resizes)
+    with stage("warp_squares"):
+        crops = warp_squares(img, corners * scale, img_size=img_size, pad=2)
+    with stage("flip"):
+        crops = maybe_flip_squares(crops)  # ensure A1 is dark in bottom-left to match FEN order
     labels = parse_fen_placement(fen_str.strip())
+    count("images")
+    count("squares", len(crops))
+    return crops, labels
+
+# PNG path of each labelled crop: out_root/<label>/<stem>_<i>.png
+def crop_paths(image_path, labels, out_root):
+    return [str(Path(out_root) / lab / f"{Path(image_path).stem}_{i:02d}.png") for i, lab in enumerate(labels)]
+
+# Warp one photo into its 64 labelled crops and save them as PNGs under out_root/<label>/
+# With a `writer` thread pool, the 64 PNG encodes/writes run concurrently (cv2 releases the GIL)
+def process_one(image_path, corners_path, fen_str, out_root, img_size=96, writer=None, reduce=True):
+    result = crops_for_image(image_path, corners_path, fen_str, img_size, reduce)
+    if result is None:
+        return 0
+    crops, labels = result
 
     for lab in LABELS:
         (out_root / lab).mkdir(parents=True, exist_ok=True)
 
-    for i, (crop, lab) in enumerate(zip(crops, labels)):
-        out_path = out_root / lab / f"{Path(image_path).stem}_{i:02d}.png"
-        resized = cv2.resize(crop, (img_size, img_size), interpolation=cv2.INTER_AREA)
-        cv2.imwrite(str(out_path), resized)
+    out_paths = crop_paths(image_path, labels, out_root)
+    with stage("write_png"):
+        if writer:
+            for f in [writer.submit(cv2.imwrite, p, crop) for p, crop in zip(out_paths, crops)]:
+                f.result()
+        else:
+            for p, crop in zip(out_paths, crops):
+                cv2.imwrite(p, crop)
 
     print(f"✅ {image_path.name} → {len(crops)} squares saved")
+    return len(crops)
+
+# Same as process_one, but appends the crops to a packed.ShardWriter instead of writing PNGs
+def pack_one(image_path, corners_path, fen_str, shard_writer, img_size=96, reduce=True):
+    source = Path(image_path).stem
+    if shard_writer.has(source):
+        print(f"{image_path.name} already packed, skipping.")
+        return 0
+    result = crops_for_image(image_path, corners_path, fen_str, img_size, reduce)
+    if result is None:
+        return 0
+    crops, labels = result
+    with stage("pack"):
+        shard_writer.add(crops, labels, source)
+    print(f"✅ {image_path.name} → {len(crops)} squares packed")
+    return len(crops)
+
+# With a catalog: False if this image's crops are up to date (photo, corners, FEN, img_size
+# unchanged since its last build). Before a PNG rebuild the previous crop files are removed,
+# since a changed FEN can move them to other label folders. The packed shards are append-only,
+# so an image changed after packing is reported and needs a full build_all --format npy.
+def incremental_check(catalog, img_path, dataset_root, fmt, key):
+    last = catalog.last_build(img_path, dataset_root, fmt)
+    if last == key:
+        print(f"{Path(img_path).name} unchanged, skipping.")
+        return False
+    if last and fmt == "npy":
+        print(f"⚠️ {Path(img_path).name} changed since it was packed; rebuild the shards with build_all --format npy")
+        return False
+    if last:
+        catalog.remove_crops(img_path, dataset_root)
+    return True
+
+def record_build(catalog, img_path, dataset_root, fmt, key):
+    labels = parse_fen_placement(key["fen"])
+    files = crop_paths(img_path, labels, Path(dataset_root) / "raw") if fmt == "png" else None
+    catalog.record_build(img_path, dataset_root, fmt, key, labels, files)
+
+# Read a fen_list.csv (filename,FEN per line) into {filename: FEN}
+def read_fen_file(fen_file):
+    fen_lines = [l.strip() for l in open(fen_file) if l.strip()]
+    fen_map = {}
+    for line in fen_lines:
+        try:
+            name, fen_str = line.split(",", 1)
+            fen_map[name.strip()] = fen_str.strip()
+        except ValueError:
+            print(f"⚠️ Skipping malformed line: {line}")
+    return fen_map
+
+# (image_path, corners_path, fen) for every image in folder that has both a FEN and corners
+def collect_jobs(folder, corners_dir, fen_map):
+    jobs = []
+    for img_path in sorted(Path(folder).glob("*")):
+        if img_path.suffix.lower() not in [".jpg", ".jpeg", ".png", ".bmp"]:
+            continue
+        name = img_path.name
+        fen_str = fen_map.get(name)
+        if not fen_str:
+            print(f"⚠️ No FEN found for {name}, skipping.")
+            continue
+        corners_path = Path(corners_dir) / f"{img_path.stem}.json"
+        if not corners_path.exists():
+            print(f"⚠️ Missing corners for {name}, skipping.")
+            continue
+        jobs.append((img_path, corners_path, fen_str))
+    return jobs
 
 def main():
     ap = argparse.ArgumentParser()
@@ -55,46 +150,64 @@ def main():
     ap.add_argument("--fen-file", type=str, help="Text file: filename,FEN per line")
     ap.add_argument("--dataset-root", required=True, type=str)
     ap.add_argument("--img-size", type=int, default=96)
+    ap.add_argument("--format", choices=["png", "npy"], default="png",
+                    help="png: one file per crop under raw/<label>/; npy: memmappable shards under packed/")
+    ap.add_argument("--full-decode", action="store_true", help="Always decode photos at full resolution")
+    ap.add_argument("--catalog", type=str, help="SQLite catalog (catalog.py): only rebuild new or changed images")
+    add_profile_args(ap)
     args = ap.parse_args()
 
+    start_profiling(args)
+    try:
+        run(args)
+    finally:
+        finish_profiling(args)
+
+def run(args):
     out_root = Path(args.dataset_root) / "raw"
+    # packed mode appends to <dataset-root>/packed/, like PNG mode accumulates into raw/
+    shard_writer = ShardWriter(Path(args.dataset_root) / "packed", args.img_size) if args.format == "npy" else None
+
+    catalog = Catalog(args.catalog) if args.catalog else None
+
+    def build(img_path, corners_path, fen_str):
+        if catalog:
+            key = catalog.build_key(img_path, corners_path, fen_str, args.img_size)
+            if not incremental_check(catalog, img_path, args.dataset_root, args.format, key):
+                return
+        if shard_writer:
+            n = pack_one(img_path, corners_path, fen_str, shard_writer, img_size=args.img_size,
+                         reduce=not args.full_decode)
+        else:
+            n = process_one(img_path, corners_path, fen_str, out_root, img_size=args.img_size,
+                            reduce=not args.full_decode)
+        if catalog and n:
+            record_build(catalog, img_path, args.dataset_root, args.format, key)
 
     # Option A — single image mode
     if args.image:
         if not (args.corners and args.fen):
             raise SystemExit("For single-image mode, supply --image, --corners, and --fen")
-        process_one(Path(args.image), Path(args.corners), args.fen, out_root, img_size=args.img_size)
+        build(Path(args.image), Path(args.corners), args.fen)
+        if shard_writer:
+            shard_writer.close()
+        if catalog:
+            catalog.close()
         return
 
     # Option B — folder mode
     if not (args.folder and args.corners_dir and args.fen_file):
         raise SystemExit("For folder mode, supply --folder, --corners-dir, and --fen-file")
 
-    folder = Path(args.folder)
-    corners_dir = Path(args.corners_dir)
-    fen_lines = [l.strip() for l in open(args.fen_file) if l.strip()]
-    fen_map = {}
-    for line in fen_lines:
-        try:
-            name, fen_str = line.split(",", 1)
-            fen_map[name.strip()] = fen_str.strip()
-        except ValueError:
-            print(f"⚠️ Skipping malformed line: {line}")
-
-    for img_path in sorted(folder.glob("*")):
-        if img_path.suffix.lower() not in [".jpg", ".jpeg", ".png", ".bmp"]:
-            continue
-        name = img_path.name
-        fen_str = fen_map.get(name)
-        if not fen_str:
-            print(f"⚠️ No FEN found for {name}, skipping.")
-            continue
-        corners_path = corners_dir / f"{img_path.stem}.json"
-        if not corners_path.exists():
-            print(f"⚠️ Missing corners for {name}, skipping.")
-            continue
-        process_one(img_path, corners_path, fen_str, out_root, img_size=args.img_size)
+    fen_map = read_fen_file(args.fen_file)
+    for img_path, corners_path, fen_str in collect_jobs(args.folder, args.corners_dir, fen_map):
+        build(img_path, corners_path, fen_str)
 
+    if shard_writer:
+        print(f"{shard_writer.close()} crops in {Path(args.dataset_root) / 'packed'}")
+    if catalog:
+        print(catalog.summary())
+        catalog.close()
     print("✅ Dataset build complete.")
 
 if __name__ == "__main__":
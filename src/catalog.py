@@ -0,0 +1,224 @@
+"""
+catalog.py
+Project catalog in one SQLite file (default data/catalog.sqlite). It indexes:
+    images       path, position folder, content hash (sha1), FEN, corners
+    builds       what each image's crops were last built from (hash, corners, FEN, img_size)
+    crops        the crop files written by each build (PNG mode)
+    predictions  FENs predicted per (image hash, corners, JPEG decode factor, board, model hash, img_size, flip)
+build_dataset / build_all --catalog skip images whose photo, corners, FEN and img_size are
+unchanged since their last build (and delete stale PNGs when one did change).
+infer_image --catalog returns stored predictions for photos it has already seen with this
+model, without decoding them. Content hashes are only recomputed when a file's size or mtime changes.
+Import the existing input_imgs/<n>/fen_list.csv + data/corners/<n>/*.json layout once
+(re-running it picks up new photos, FENs and corners):
+    python -m src.catalog --positions input_imgs --corners data/corners
+"""
+
+import argparse, hashlib, json, os, sqlite3, time
+from pathlib import Path
+
+DEFAULT_DB = os.path.join("data", "catalog.sqlite")
+IMG_EXTS = [".jpg", ".jpeg", ".png", ".bmp"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    position TEXT,
+    size INTEGER,
+    mtime REAL,
+    sha1 TEXT,
+    fen TEXT,
+    corners TEXT
+);
+CREATE TABLE IF NOT EXISTS builds (
+    path TEXT NOT NULL,
+    dataset_root TEXT NOT NULL,
+    format TEXT NOT NULL,
+    img_size INTEGER NOT NULL,
+    sha1 TEXT,
+    corners TEXT,
+    fen TEXT,
+    n_crops INTEGER,
+    built_at REAL,
+    PRIMARY KEY (path, dataset_root, format)
+);
+CREATE TABLE IF NOT EXISTS crops (
+    path TEXT NOT NULL,
+    dataset_root TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    label TEXT,
+    file TEXT,
+    PRIMARY KEY (path, dataset_root, idx)
+);
+CREATE TABLE IF NOT EXISTS predictions (
+    sha1 TEXT NOT NULL,
+    corners TEXT NOT NULL,
+    decode_factor INTEGER NOT NULL,
+    board TEXT NOT NULL,
+    model TEXT NOT NULL,
+    img_size INTEGER NOT NULL,
+    flip180 INTEGER NOT NULL,
+    path TEXT,
+    placement TEXT,
+    fen TEXT,
+    created_at REAL,
+    PRIMARY KEY (sha1, corners, decode_factor, board, model, img_size, flip180)
+);
+"""
+
+def norm_path(path):
+    return Path(os.path.normpath(str(path))).as_posix()
+
+# Corners file content in a canonical form, so formatting-only edits don't count as changes
+def corners_text(corners_path):
+    return json.dumps(json.load(open(corners_path)), sort_keys=True, separators=(",", ":"))
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class Catalog:
+    def __init__(self, path=DEFAULT_DB):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        # predictions stored before the decode factor was part of their key can't be told apart: drop them
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(predictions)")]
+        if columns and "decode_factor" not in columns:
+            print(f"⚠️ Discarding stored predictions in {self.path} (made before decode modes were recorded)")
+            self.db.execute("DROP TABLE predictions")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def commit(self):
+        self.db.commit()
+
+    # Content hash of an image, recomputed only when its size or mtime changed
+    def image_hash(self, img_path):
+        key = norm_path(img_path)
+        st = os.stat(img_path)
+        row = self.db.execute("SELECT size, mtime, sha1 FROM images WHERE path = ?", (key,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime and row[2]:
+            return row[2]
+        sha1 = file_sha1(img_path)
+        self.db.execute("INSERT INTO images (path, size, mtime, sha1) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, "
+                        "sha1 = excluded.sha1", (key, st.st_size, st.st_mtime, sha1))
+        return sha1
+
+    def register_image(self, img_path, position=None, fen=None, corners_path=None):
+        sha1 = self.image_hash(img_path)
+        corners = corners_text(corners_path) if corners_path and Path(corners_path).exists() else None
+        self.db.execute("UPDATE images SET position = COALESCE(?, position), fen = COALESCE(?, fen), "
+                        "corners = COALESCE(?, corners) WHERE path = ?",
+                        (position, fen, corners, norm_path(img_path)))
+        return sha1
+
+    # One-time (idempotent) import of positions/<n>/fen_list.csv (or fen.txt) + corners/<n>/<stem>.json
+    def import_layout(self, positions, corners_root):
+        from .build_dataset import read_fen_file
+        counts = {"images": 0, "with_fen": 0, "with_corners": 0}
+        for folder in sorted(Path(positions).iterdir()):
+            if not folder.is_dir():
+                continue
+            fen_map = read_fen_file(folder / "fen_list.csv") if (folder / "fen_list.csv").exists() else {}
+            fen_txt = (folder / "fen.txt").read_text().strip() if (folder / "fen.txt").exists() else None
+            for img_path in sorted(folder.iterdir()):
+                if img_path.suffix.lower() not in IMG_EXTS:
+                    continue
+                fen = fen_map.get(img_path.name, fen_txt)
+                corners_path = Path(corners_root) / folder.name / f"{img_path.stem}.json"
+                self.register_image(img_path, folder.name, fen, corners_path)
+                counts["images"] += 1
+                counts["with_fen"] += fen is not None
+                counts["with_corners"] += corners_path.exists()
+        self.commit()
+        return counts
+
+    # What a build of this image depends on; compared against the last build record
+    def build_key(self, img_path, corners_path, fen, img_size):
+        return {"sha1": self.register_image(img_path, fen=fen.strip(), corners_path=corners_path),
+                "corners": corners_text(corners_path), "fen": fen.strip(), "img_size": int(img_size)}
+
+    def last_build(self, img_path, dataset_root, fmt):
+        row = self.db.execute("SELECT sha1, corners, fen, img_size FROM builds "
+                              "WHERE path = ? AND dataset_root = ? AND format = ?",
+                              (norm_path(img_path), norm_path(dataset_root), fmt)).fetchone()
+        return dict(zip(["sha1", "corners", "fen", "img_size"], row)) if row else None
+
+    def is_built(self, img_path, dataset_root, fmt, key):
+        return self.last_build(img_path, dataset_root, fmt) == key
+
+    # Delete the crop files of this image's previous build (labels may have changed)
+    def remove_crops(self, img_path, dataset_root):
+        rows = self.db.execute("SELECT file FROM crops WHERE path = ? AND dataset_root = ?",
+                               (norm_path(img_path), norm_path(dataset_root))).fetchall()
+        for (file,) in rows:
+            if file and os.path.exists(file):
+                os.remove(file)
+        self.db.execute("DELETE FROM crops WHERE path = ? AND dataset_root = ?",
+                        (norm_path(img_path), norm_path(dataset_root)))
+        return len(rows)
+
+    def record_build(self, img_path, dataset_root, fmt, key, labels, files=None):
+        path, root = norm_path(img_path), norm_path(dataset_root)
+        self.db.execute("INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (path, root, fmt, key["img_size"], key["sha1"], key["corners"], key["fen"],
+                         len(labels), time.time()))
+        files = files or [None] * len(labels)
+        self.db.executemany("INSERT OR REPLACE INTO crops VALUES (?, ?, ?, ?, ?)",
+                            [(path, root, i, lab, f) for i, (lab, f) in enumerate(zip(labels, files))])
+        self.commit()
+
+    # Stored predictions for every board of a photo, {board: (placement, fen)}, or None if any is missing
+    # decode_factor: the JPEG reduction the crops were sampled from (1 = full decode)
+    def get_predictions(self, sha1, corners, decode_factor, boards, model, img_size, flip180):
+        rows = self.db.execute("SELECT board, placement, fen FROM predictions WHERE sha1 = ? AND corners = ? "
+                               "AND decode_factor = ? AND model = ? AND img_size = ? AND flip180 = ?",
+                               (sha1, corners, int(decode_factor), model, int(img_size), int(flip180))).fetchall()
+        found = {board: (placement, fen) for board, placement, fen in rows}
+        wanted = [b or "" for b in boards]
+        if not all(b in found for b in wanted):
+            return None
+        return {b: found[b] for b in wanted}
+
+    def put_prediction(self, sha1, corners, decode_factor, board, model, img_size, flip180, img_path, placement, fen):
+        self.db.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (sha1, corners, int(decode_factor), board or "", model, int(img_size), int(flip180),
+                         norm_path(img_path), placement, fen, time.time()))
+
+    def summary(self):
+        q = lambda sql: self.db.execute(sql).fetchone()[0]
+        return (f"catalog {self.path}: {q('SELECT COUNT(*) FROM images')} images "
+                f"({q('SELECT COUNT(*) FROM images WHERE fen IS NOT NULL')} with FEN, "
+                f"{q('SELECT COUNT(*) FROM images WHERE corners IS NOT NULL')} with corners), "
+                f"{q('SELECT COUNT(*) FROM builds')} builds, {q('SELECT COUNT(*) FROM crops')} crops, "
+                f"{q('SELECT COUNT(*) FROM predictions')} predictions")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", type=str, default=DEFAULT_DB, help="Catalog file")
+    ap.add_argument("--positions", type=str, default="input_imgs", help="Folder of <n>/ position folders")
+    ap.add_argument("--corners", type=str, default=os.path.join("data", "corners"), help="Folder of <n>/ corner folders")
+    ap.add_argument("--status", action="store_true", help="Only print what the catalog holds")
+    args = ap.parse_args()
+
+    catalog = Catalog(args.db)
+    try:
+        if not args.status:
+            t0 = time.perf_counter()
+            counts = catalog.import_layout(args.positions, args.corners)
+            print(f"✅ Imported {counts['images']} images ({counts['with_fen']} with FEN, "
+                  f"{counts['with_corners']} with corners) in {time.perf_counter() - t0:.2f}s")
+        print(catalog.summary())
+    finally:
+        catalog.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+compare_backends.py
+Compare exported classifiers (.keras / .tflite / .onnx, see backends.py) on the same photos:
+- cold start: wall time of a fresh `python -m src.infer_image` process, start to printed FEN
+- per-board latency: one 64-crop predict, after warm-up (median over --repeats)
+- accuracy check: per-square agreement of each model's predicted classes with the Keras
+  reference model (--reference, default the first .keras in --models), plus how many
+  whole-board FENs match exactly.
+"""
+
+import argparse, subprocess, sys, time, numpy as np, cv2
+from pathlib import Path
+from .backends import load_backend, load_class_names
+from .infer_image import board_batch, load_corners, collect_jobs
+
+def cold_start(model_path, image, corners):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "src.infer_image", "--image", image, "--corners", corners,
+                    "--model", str(model_path)], check=True, capture_output=True)
+    return time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--models", nargs="+", required=True, help="Model files to compare (.keras/.tflite/.onnx)")
+    ap.add_argument("--reference", type=str, help="Keras model to check agreement against")
+    ap.add_argument("--folder", required=True, type=str, help="Folder with test images")
+    ap.add_argument("--corners-dir", required=True, type=str, help="Folder with their corner JSONs")
+    ap.add_argument("--img-size", type=int, default=96)
+    ap.add_argument("--repeats", type=int, default=20)
+    ap.add_argument("--skip-cold-start", action="store_true")
+    args = ap.parse_args()
+
+    args.glob, args.manifest = None, None
+    jobs = collect_jobs(args)
+    if not jobs:
+        raise SystemExit("No images with corners found.")
+    boards = [board_batch(cv2.imread(str(img)), load_corners(c), args.img_size) for img, c in jobs]
+    crops = np.concatenate(boards, axis=0).astype(np.float32) / 255.0
+
+    reference = args.reference or next((m for m in args.models if Path(m).suffix == ".keras"), None)
+    if reference is None:
+        raise SystemExit("Need a .keras --reference model for the accuracy check")
+
+    def predicted_names(model, class_names):
+        probs = np.concatenate([model.predict(crops[i:i+64]) for i in range(0, len(crops), 64)])
+        return np.array(class_names)[probs.argmax(axis=1)]
+
+    ref_names = predicted_names(load_backend(reference), load_class_names(reference))
+
+    rows = []
+    for model_path in args.models:
+        print(f"=== {model_path}")
+        cold = None if args.skip_cold_start else cold_start(model_path, str(jobs[0][0]), str(jobs[0][1]))
+        t0 = time.perf_counter()
+        model = load_backend(model_path)
+        load_s = time.perf_counter() - t0
+        one = crops[:64]
+        model.predict(one)  # warm-up
+        times = []
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            model.predict(one)
+            times.append(time.perf_counter() - t0)
+        names = predicted_names(model, load_class_names(model_path))
+        agree = float((names == ref_names).mean())
+        fen_match = int((names.reshape(-1, 64) == ref_names.reshape(-1, 64)).all(axis=1).sum())
+        rows.append((Path(model_path).name, model.name, cold, load_s, 1000.0 * float(np.median(times)),
+                     agree, fen_match, Path(model_path).stat().st_size / 1e6))
+
+    print(f"\nReference: {reference}, {len(jobs)} boards")
+    print(f"{'model':<28} {'backend':<7} {'cold→FEN s':>10} {'load s':>7} {'ms/board':>9} "
+          f"{'agree %':>8} {'FENs =':>7} {'MB':>6}")
+    for name, backend, cold, load_s, ms, agree, fen_match, mb in rows:
+        cold_str = f"{cold:10.2f}" if cold is not None else f"{'-':>10}"
+        print(f"{name:<28} {backend:<7} {cold_str} {load_s:7.2f} {ms:9.1f} "
+              f"{100 * agree:8.2f} {fen_match:>3}/{len(jobs):<3} {mb:6.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+decode.py
+Reduced-resolution photo decoding. Phone photos (4032x3024) are decoded in full only to be
+sampled down to 64 crops of img_size, or shown at a fraction of their size in annotate_corners.py.
+JPEG can decode at 1/2, 1/4 or 1/8 scale straight from the DCT coefficients, which is faster
+and needs a fraction of the memory. decode_for_boards picks the largest reduction that still
+leaves at least one source pixel per output pixel on every board edge, and returns the scale
+the caller multiplies its (full-resolution) corners by.
+    img, scale = decode_for_boards(path, [corners], img_size=96)
+    crops = warp_squares(img, corners * scale, img_size=96)
+Run as a module to measure decode time and peak RSS per image for each reduction
+(every measurement runs in a fresh child process so peak RSS is per decode):
+    python -m src.decode --folder input_imgs/6 --corners-dir data/corners/6
+"""
+
+import argparse, json, subprocess, sys, time, numpy as np, cv2
+from pathlib import Path
+from PIL import Image
+
+FACTORS = (8, 4, 2, 1)
+CV2_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+             4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# (width, height) as cv2.imread would return it, from the file header only (no decode)
+def image_size(path):
+    with Image.open(path) as im:
+        w, h = im.size
+        # EXIF orientations 5-8 are 90° rotations, which cv2.imread applies
+        if im.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            w, h = h, w
+    return w, h
+
+# Output pixels warp_squares produces along one board edge: 8 crops of img_size, each
+# covering (100 + 2*pad)/100 of a square
+def needed_edge_px(img_size, pad=2):
+    return 8 * img_size * 100.0 / (100 + 2 * pad)
+
+# Largest JPEG reduction (8, 4, 2 or 1) that keeps the shortest edge of every board at
+# least `needed_edge_px` pixels long
+def pick_factor(corners_list, img_size=96, pad=2):
+    shortest = min(float(np.linalg.norm(np.roll(c, -1, axis=0) - c, axis=1).min())
+                   for c in (np.asarray(c, dtype=np.float32) for c in corners_list))
+    need = needed_edge_px(img_size, pad)
+    for f in FACTORS:
+        if shortest / f >= need:
+            return f
+    return 1
+
+# Decode at 1/factor resolution; method "cv2" (IMREAD_REDUCED_*) or "pillow" (draft mode)
+def decode(path, factor=1, method="cv2"):
+    if method == "pillow":
+        with Image.open(path) as im:
+            if factor > 1:
+                im.draft("RGB", (im.width // factor, im.height // factor))
+            return cv2.cvtColor(np.asarray(im.convert("RGB")), cv2.COLOR_RGB2BGR)
+    return cv2.imread(str(path), CV2_FLAGS[factor])
+
+# Decode just enough resolution for these boards; returns (img, scale) with img None if
+# the file can't be read. Multiply full-resolution corners by scale to use them on img.
+def decode_for_boards(path, corners_list, img_size=96, pad=2, reduce=True):
+    factor = pick_factor(corners_list, img_size, pad) if reduce else 1
+    img = decode(path, factor)
+    if img is None or factor == 1:
+        return img, 1.0
+    # the reduced decode rounds odd sizes up, so take the exact ratio from the header
+    return img, img.shape[1] / image_size(path)[0]
+
+# Largest reduction whose long side still covers `max_side` pixels (for display)
+def factor_for_display(path, max_side):
+    long_side = max(image_size(path))
+    for f in FACTORS:
+        if long_side / f >= max_side:
+            return f
+    return 1
+
+# --- measurement -----------------------------------------------------------------------
+
+# Child process: decode one image `repeats` times, print timing + own peak RSS as JSON
+def _measure_child(path, factor, method, repeats):
+    import resource
+    base_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times, shape = [], None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        img = decode(path, factor, method)
+        times.append(time.perf_counter() - t0)
+        shape = img.shape
+        del img
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"ms": 1000.0 * float(np.median(times)), "rss_mb": (peak_kb - base_kb) / 1024.0,
+                      "shape": list(shape)}))
+
+def measure(path, factor, method, repeats):
+    out = subprocess.run([sys.executable, "-m", "src.decode", "--child", str(path), "--factor", str(factor),
+                          "--method", method, "--repeats", str(repeats)],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--folder", type=str, help="Folder with photos to measure")
+    ap.add_argument("--corners-dir", type=str, help="Their corner JSONs, to report the factor each one gets")
+    ap.add_argument("--img-size", type=int, default=96)
+    ap.add_argument("--repeats", type=int, default=3)
+    ap.add_argument("--child", type=str, help=argparse.SUPPRESS)
+    ap.add_argument("--factor", type=int, default=1, help=argparse.SUPPRESS)
+    ap.add_argument("--method", type=str, default="cv2", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        _measure_child(args.child, args.factor, args.method, args.repeats)
+        return
+    if not args.folder:
+        raise SystemExit("Provide --folder")
+    paths = sorted(p for p in Path(args.folder).iterdir() if p.suffix.lower() in [".jpg", ".jpeg"])
+    if not paths:
+        raise SystemExit("No JPEG images found in folder.")
+
+    modes = [("cv2", 1), ("cv2", 2), ("cv2", 4), ("cv2", 8), ("pillow", 2), ("pillow", 4)]
+    rows = {m: [] for m in modes}
+    picked = []
+    for path in paths:
+        if args.corners_dir:
+            corners_path = Path(args.corners_dir) / f"{path.stem}.json"
+            if corners_path.exists():
+                from .infer_image import load_boards
+                boards = [c for _, c in load_boards(corners_path)]
+                picked.append(pick_factor(boards, args.img_size))
+        for method, factor in modes:
+            rows[(method, factor)].append(measure(path, factor, method, args.repeats))
+        print(f"measured {path.name}")
+
+    full = rows[("cv2", 1)]
+    full_ms = np.mean([r["ms"] for r in full])
+    full_mb = np.mean([r["rss_mb"] for r in full])
+    print(f"\n{len(paths)} images, median of {args.repeats} decodes each, peak RSS above interpreter baseline")
+    print(f"{'method':<8} {'factor':>6} {'size':>11} {'ms':>8} {'speedup':>8} {'peak MB':>8} {'saved':>7}")
+    for (method, factor), rs in rows.items():
+        ms = np.mean([r["ms"] for r in rs])
+        mb = np.mean([r["rss_mb"] for r in rs])
+        h, w = rs[0]["shape"][:2]
+        print(f"{method:<8} {'1/' + str(factor):>6} {f'{w}x{h}':>11} {ms:8.1f} {full_ms / ms:7.2f}x "
+              f"{mb:8.1f} {100 * (1 - mb / max(full_mb, 1e-9)):6.0f}%")
+    if picked:
+        counts = {f: picked.count(f) for f in sorted(set(picked))}
+        print(f"factor picked for --img-size {args.img_size}: " +
+              ", ".join(f"1/{f} x{n}" for f, n in counts.items()))
+
+if __name__ == "__main__":
+    main()
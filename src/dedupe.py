@@ -0,0 +1,239 @@
+"""
+dedupe.py
+Near-duplicate index over the square crops, for a smaller, class-balanced training set.
+Every photo of a position folder shares one FEN, so raw/<label>/ collects many near-identical
+crops of the same squares (mostly empty squares and pawns) that cost training time and add little.
+1. Each crop gets a 64-bit perceptual hash (DCT of a 32x32 grayscale thumbnail, 8x8 low
+   frequencies thresholded at their median).
+2. Within each class, crops whose hashes differ in at most --max-distance bits are linked:
+   identical hashes are collapsed first, then multi-index hashing finds the near pairs (split the
+   64 bits into max-distance+1 bands; any two hashes that close agree exactly on one band, so
+   only hashes sharing a band value are compared). Union-find turns the links into groups.
+3. The manifest keeps --keep-per-group crops of every group, then caps each class at
+   --max-per-class (default: the median class size after dedup) for balance.
+Works on a PNG dataset (--dataset-root raw/) or a packed one (--packed). Writes a CSV manifest
+(path,label,group or index,label,group) for train_classifier.py --manifest, and prints the shrinkage.
+--evaluate N trains the small CNN for N epochs on the full training photos and --dedup-epochs
+(default N) on their deduplicated subset, validating both on the same held-out photos, and
+reports epoch time, total training time, accuracy and balanced accuracy (mean per-class recall;
+plain accuracy is dominated by empty squares).
+"""
+
+import argparse, csv, json, time, numpy as np, cv2
+from pathlib import Path
+from .packed import CLASSES, open_packed, gather
+
+# 64-bit perceptual hashes of (N, h, w, C) uint8 crops, as uint64
+def phash(crops):
+    out = np.empty(len(crops), dtype=np.uint64)
+    weights = (np.uint64(1) << np.arange(64, dtype=np.uint64))
+    for i, crop in enumerate(crops):
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+        low = cv2.dct(small)[:8, :8].ravel()
+        bits = low > np.median(low[1:])  # DC term left out of the median
+        out[i] = np.bitwise_or.reduce(weights[bits]) if bits.any() else 0
+    return out
+
+def popcount(x):
+    x = x.astype(np.uint64)
+    count = np.zeros(x.shape, dtype=np.uint8)
+    for shift in range(0, 64, 8):
+        count += POPCOUNT8[((x >> np.uint64(shift)) & np.uint64(0xFF)).astype(np.uint8)]
+    return count
+
+POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:  # path compression
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+# Group ids for hashes: items within max_distance bits of each other (transitively) share a group
+def group_hashes(hashes, max_distance=10):
+    uniq, inverse = np.unique(hashes, return_inverse=True)
+    uf = UnionFind(len(uniq))
+    bands = max_distance + 1
+    edges = np.linspace(0, 64, bands + 1).astype(int)
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        mask = np.uint64((1 << (hi - lo)) - 1)
+        keys = (uniq >> np.uint64(lo)) & mask
+        order = np.argsort(keys, kind="stable")
+        splits = np.flatnonzero(np.diff(keys[order])) + 1
+        for bucket in np.split(order, splits):
+            if len(bucket) < 2:
+                continue
+            # all pairs within the bucket, one row at a time to bound memory
+            for j in range(len(bucket) - 1):
+                rest = bucket[j + 1:]
+                close = rest[popcount(uniq[bucket[j]] ^ uniq[rest]) <= max_distance]
+                for k in close:
+                    uf.union(bucket[j], k)
+    roots = np.array([uf.find(i) for i in range(len(uniq))])
+    return roots[inverse]
+
+# (keys, labels, crops loader) for a PNG raw/<label>/ root or a packed root
+# keys are PNG paths or global packed indices; sources name the photo each crop came from
+def load_items(dataset_root=None, packed=None):
+    if packed:
+        images, starts, labels, index = open_packed(packed)
+        keys = np.arange(len(labels))
+        names = [index["classes"][l] for l in labels]
+        sources = [index["sources"][i // 64] for i in keys]
+        def crops(sel):
+            return gather(images, starts, np.asarray(sel))[1]
+        return list(keys), names, sources, crops
+    paths = sorted(p for p in Path(dataset_root).glob("*/*.png"))
+    names = [p.parent.name for p in paths]
+    sources = [p.stem.rsplit("_", 1)[0] for p in paths]
+    def crops(sel):
+        return [cv2.imread(str(p)) for p in sel]
+    return [str(p) for p in paths], names, sources, crops
+
+def build_manifest(keys, names, hashes, max_distance=10, keep_per_group=1, max_per_class=None, seed=1337):
+    rng = np.random.default_rng(seed)
+    keys, names = np.asarray(keys, dtype=object), np.asarray(names)
+    kept, groups_of = {}, {}
+    for label in sorted(set(names)):
+        idx = np.flatnonzero(names == label)
+        groups = group_hashes(hashes[idx], max_distance)
+        chosen = []
+        for g in np.unique(groups):
+            members = idx[groups == g]
+            chosen.extend(rng.permutation(members)[:keep_per_group])
+            for m in members:
+                groups_of[m] = f"{label}:{g}"
+        kept[label] = np.array(sorted(chosen))
+    cap = max_per_class or int(np.median([len(v) for v in kept.values()]))
+    rows = []
+    for label, idx in kept.items():
+        if len(idx) > cap:
+            idx = np.sort(rng.choice(idx, cap, replace=False))
+        rows.extend((keys[i], label, groups_of[i]) for i in idx)
+    return rows, {label: len(v) for label, v in kept.items()}, cap
+
+def write_manifest(rows, out_path, packed=False):
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["index" if packed else "path", "label", "group"])
+        w.writerows(rows)
+
+def read_manifest(path):
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+    packed = "index" in reader.fieldnames
+    keys = [int(r["index"]) for r in rows] if packed else [r["path"] for r in rows]
+    return keys, [r["label"] for r in rows], packed
+
+# --- evaluation --------------------------------------------------------------------------
+
+# Train the small CNN on two training sets, validating on the same held-out photos
+def evaluate(keys, names, sources, crops_fn, manifest_keys, epochs, dedup_epochs, img_size, batch_size=64,
+             seed=1337):
+    import tensorflow as tf
+    from .train_classifier import build_small_cnn
+    photos = sorted(set(sources))
+    val_photos = set(np.random.default_rng(seed).permutation(photos)[:max(1, len(photos) // 5)])
+    is_val = np.array([s in val_photos for s in sources])
+    in_manifest = set(manifest_keys)
+    label_ids = np.array([CLASSES.index(n) for n in names])
+
+    def arrays(mask):
+        sel = [k for k, m in zip(keys, mask) if m]
+        x = np.stack([cv2.resize(c, (img_size, img_size)) for c in crops_fn(sel)]).astype(np.float32) / 255.0
+        return x, tf.keras.utils.to_categorical(label_ids[mask], len(CLASSES))
+
+    x_val, y_val = arrays(is_val)
+    results = {}
+    in_dedup = ~is_val & np.array([k in in_manifest for k in keys])
+    for name, mask, n_epochs in [("full", ~is_val, epochs), ("dedup", in_dedup, dedup_epochs)]:
+        x, y = arrays(mask)
+        tf.keras.utils.set_random_seed(seed)
+        model = build_small_cnn(len(CLASSES), img_size)
+        times = []
+        class Timer(tf.keras.callbacks.Callback):
+            def on_epoch_begin(self, epoch, logs=None):
+                self.t0 = time.perf_counter()
+            def on_epoch_end(self, epoch, logs=None):
+                times.append(time.perf_counter() - self.t0)
+        model.fit(x, y, epochs=n_epochs, batch_size=batch_size, shuffle=True, verbose=2, callbacks=[Timer()])
+        pred = model.predict(x_val, batch_size=256, verbose=0).argmax(axis=1)
+        truth = y_val.argmax(axis=1)
+        recalls = [float((pred[truth == c] == c).mean()) for c in np.unique(truth)]
+        results[name] = {"train_crops": len(x), "epochs": n_epochs, "epoch_s": float(np.median(times)),
+                         "train_s": float(sum(times)), "val_acc": float((pred == truth).mean()),
+                         "val_balanced_acc": float(np.mean(recalls))}
+    return results, len(x_val), len(val_photos)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dataset-root", type=str, help="PNG crops in <label>/ folders (e.g. data/dataset/raw)")
+    ap.add_argument("--packed", type=str, help="Packed shard folder instead (build_dataset --format npy)")
+    ap.add_argument("--out", type=str, default="data/dataset/manifest.csv", help="Manifest CSV to write")
+    ap.add_argument("--max-distance", type=int, default=10, help="Hamming distance (of 64 bits) for near-duplicates")
+    ap.add_argument("--keep-per-group", type=int, default=1, help="Crops kept from each near-duplicate group")
+    ap.add_argument("--max-per-class", type=int, help="Cap per class (default: median class size after dedup)")
+    ap.add_argument("--evaluate", type=int, metavar="EPOCHS", help="Compare training on full vs deduplicated set")
+    ap.add_argument("--dedup-epochs", type=int, help="Epochs for the deduplicated run (default: --evaluate)")
+    ap.add_argument("--img-size", type=int, default=96, help="Crop size for --evaluate")
+    args = ap.parse_args()
+
+    if not (args.dataset_root or args.packed):
+        raise SystemExit("Provide --dataset-root or --packed")
+    keys, names, sources, crops_fn = load_items(args.dataset_root, args.packed)
+    if not keys:
+        raise SystemExit("No crops found.")
+
+    t0 = time.perf_counter()
+    hashes = np.concatenate([phash(crops_fn(keys[i:i+512])) for i in range(0, len(keys), 512)])
+    t_hash = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    rows, deduped, cap = build_manifest(keys, names, hashes, args.max_distance, args.keep_per_group,
+                                        args.max_per_class)
+    t_group = time.perf_counter() - t0
+    write_manifest(rows, args.out, packed=bool(args.packed))
+
+    before = {label: names.count(label) for label in sorted(set(names))}
+    after = {}
+    for _, label, _ in rows:
+        after[label] = after.get(label, 0) + 1
+    print(f"{'class':<14} {'crops':>7} {'groups':>7} {'kept':>7}")
+    for label in before:
+        print(f"{label:<14} {before[label]:>7} {deduped[label]:>7} {after.get(label, 0):>7}")
+    print(f"{'total':<14} {len(names):>7} {sum(deduped.values()):>7} {len(rows):>7}")
+    print(f"✅ {len(names)} → {len(rows)} crops ({100 * (1 - len(rows) / len(names)):.0f}% smaller, "
+          f"class cap {cap}); hashing {t_hash:.1f}s, grouping {t_group:.2f}s → {args.out}")
+
+    if args.evaluate:
+        results, n_val, n_photos = evaluate(keys, names, sources, crops_fn, [r[0] for r in rows],
+                                            args.evaluate, args.dedup_epochs or args.evaluate, args.img_size)
+        print(f"\nvalidation: {n_val} crops from {n_photos} held-out photos")
+        print(f"{'train set':<10} {'crops':>7} {'epochs':>7} {'s/epoch':>8} {'train s':>8} {'val acc':>8} {'bal acc':>8}")
+        for name, r in results.items():
+            print(f"{name:<10} {r['train_crops']:>7} {r['epochs']:>7} {r['epoch_s']:8.2f} {r['train_s']:8.1f} "
+                  f"{100 * r['val_acc']:7.1f}% {100 * r['val_balanced_acc']:7.1f}%")
+        full, dedup = results["full"], results["dedup"]
+        print(f"epoch time {100 * (dedup['epoch_s'] / full['epoch_s'] - 1):+.0f}%, "
+              f"training time {100 * (dedup['train_s'] / full['train_s'] - 1):+.0f}%, "
+              f"val accuracy {100 * (dedup['val_acc'] - full['val_acc']):+.1f} points, "
+              f"balanced {100 * (dedup['val_balanced_acc'] - full['val_balanced_acc']):+.1f} points")
+        with open(Path(args.out).with_suffix(".eval.json"), "w") as f:
+            json.dump({"val_crops": n_val, **results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
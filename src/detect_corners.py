@@ -0,0 +1,262 @@
+"""
+detect_corners.py
+Automatic board corner detection, to replace clicking in annotate_corners.py.
+Classical OpenCV, no training:
+1. On a downscaled copy, find convex quadrilaterals in the edge map (board frame, border lines)
+   plus, when the inner 7x7 grid is visible, cv2.findChessboardCornersSB extrapolated to the
+   board edge. Each quad is also tried with several insets (frame -> playing area).
+2. Score every candidate by how checkered it looks: the 64 cell means of the warped board
+   (sampled with warp.warp_squares) are correlated with the light/dark square pattern.
+3. Refine the best candidates at full resolution by hill-climbing the same score on the
+   full-size image (warp_squares only samples the pixels it needs, so this stays cheap).
+Tracking mode (--track) starts from the previous image's corners and only refines them, falling
+back to full detection when the refined score drops below --min-confidence.
+Corners are saved through warp.save_corners, like annotate_corners.py (4 points, order_corners order,
+full-resolution image pixels). Images whose confidence stays below --min-confidence open the manual annotation
+tool instead (unless --no-manual).
+"""
+
+import argparse, time, numpy as np, cv2
+from pathlib import Path
+from .warp import order_corners, warp_squares, save_corners
+
+IMG_EXTS = [".jpg", ".jpeg", ".png", ".bmp"]
+CHECKER = np.indices((8, 8)).sum(axis=0) % 2 * 2.0 - 1.0  # +1 / -1 alternating pattern
+CHECKER = (CHECKER - CHECKER.mean()) / CHECKER.std()
+
+# How checkered the board under `corners` looks: |correlation| of the 64 cell means with the
+# light/dark pattern, in [0, 1]. `inner` is the fraction of each cell that is sampled.
+def checker_score(gray, corners, inner=0.6, samples=6):
+    pad = int(round(100 * (1.0 - inner) / 2))
+    try:
+        cells = warp_squares(gray, corners, img_size=samples, pad=pad, cache=False)
+    except (ValueError, np.linalg.LinAlgError, cv2.error):
+        return 0.0
+    means = np.median(cells.reshape(64, -1), axis=1).reshape(8, 8)
+    std = means.std()
+    if std < 1e-6:
+        return 0.0
+    return float(abs(((means - means.mean()) / std * CHECKER).mean()))
+
+# Shrink a quad towards its centre in board space (t = fraction of the side on each edge)
+def inset_quad(quad, t):
+    H = cv2.getPerspectiveTransform(np.float32([[0, 0], [1, 0], [1, 1], [0, 1]]), quad)
+    unit = np.float32([[t, t], [1 - t, t], [1 - t, 1 - t], [t, 1 - t]]).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(unit, H).reshape(4, 2)
+
+# Reduce a convex hull to 4 vertices (coarser polygon approximation until it has at most 4)
+def hull_quad(hull):
+    for eps in np.linspace(0.01, 0.1, 19):
+        approx = cv2.approxPolyDP(hull, eps * cv2.arcLength(hull, True), True)
+        if len(approx) == 4:
+            return order_corners(approx.reshape(4, 2))
+        if len(approx) < 4:
+            break
+    return order_corners(cv2.boxPoints(cv2.minAreaRect(hull)))
+
+# Board outline candidates on a (downscaled) BGR image: the board (wooden frame + squares) is far
+# more saturated than a table or floor, so the largest saturated blob is the board; plus convex
+# quads from the edge map for boards on busier backgrounds
+def quad_candidates(small, min_area=0.04):
+    h, w = small.shape[:2]
+    quads = []
+    sat = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2HSV)[..., 1], (5, 5), 0)
+    _, mask = cv2.threshold(sat, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((15, 15), np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    for c in sorted(contours, key=cv2.contourArea, reverse=True)[:2]:
+        if cv2.contourArea(c) >= min_area * h * w:
+            quads.append(hull_quad(cv2.convexHull(c)))
+
+    gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    edges = cv2.dilate(cv2.Canny(gray, 40, 120), np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    for c in contours:
+        if cv2.contourArea(c) < min_area * h * w:
+            continue
+        hull = cv2.convexHull(c)
+        approx = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+        if len(approx) == 4:
+            quads.append(order_corners(approx.reshape(4, 2)))
+    return quads
+
+# Outer board corners from the 7x7 inner corner grid, when OpenCV can see it
+def grid_candidate(gray):
+    found, pts = cv2.findChessboardCornersSB(gray, (7, 7), flags=cv2.CALIB_CB_EXHAUSTIVE)
+    if not found:
+        return None
+    pts = pts.reshape(7, 7, 2)
+    # inner corners sit at board coords 1..7 (of 0..8); fit a homography and map the outer corners
+    board = np.float32([[c, r] for r in range(1, 8) for c in range(1, 8)])
+    H, _ = cv2.findHomography(board, pts.reshape(-1, 2))
+    if H is None:
+        return None
+    outer = np.float32([[0, 0], [8, 0], [8, 8], [0, 8]]).reshape(-1, 1, 2)
+    return order_corners(cv2.perspectiveTransform(outer, H).reshape(4, 2))
+
+# Best 9 equally spaced lines ((offset, pitch), strength) along one axis of an edge-strength profile
+def fit_lines(profile, min_pitch, max_pitch):
+    n = len(profile)
+    cum = np.concatenate([[0.0], np.cumsum(profile)])
+    best, best_fit = -1.0, (0.0, min_pitch)
+    max_pitch = max(max_pitch, min_pitch + 0.5)
+    for pitch in np.arange(min_pitch, max_pitch, 0.5):
+        x0 = np.arange(0, n - 8 * pitch - 1)
+        if len(x0) == 0:
+            break
+        idx = np.rint(x0[:, None] + pitch * np.arange(9)[None, :]).astype(int)
+        # line strength = profile summed over +-1 px around each of the 9 lines
+        s = (cum[np.minimum(idx + 2, n)] - cum[np.maximum(idx - 1, 0)]).sum(axis=1)
+        i = int(s.argmax())
+        if s[i] > best:
+            best, best_fit = float(s[i]), (float(x0[i]), float(pitch))
+    return best_fit, best
+
+# Locate the 8x8 playing area inside a board outline: rectify the outline, then fit the 9 vertical
+# and 9 horizontal grid lines to column/row sums of the edge magnitude. Returns image coords.
+def fit_grid(gray, quad, size=400):
+    dst = np.float32([[0, 0], [size, 0], [size, size], [0, size]])
+    H = cv2.getPerspectiveTransform(np.float32(quad), dst)
+    top = cv2.warpPerspective(gray, H, (size, size), flags=cv2.INTER_AREA)
+    top = cv2.GaussianBlur(top, (3, 3), 0).astype(np.float32)
+    px = np.abs(cv2.Sobel(top, cv2.CV_32F, 1, 0, ksize=3)).mean(axis=0)
+    py = np.abs(cv2.Sobel(top, cv2.CV_32F, 0, 1, ksize=3)).mean(axis=1)
+    lo, hi = 0.45 * size / 8, 1.02 * size / 8
+    # fit the stronger axis first, then keep the other pitch within 4:3 of it (squares are square)
+    (x0, xp), sx = fit_lines(px, lo, hi)
+    (y0, yp), sy = fit_lines(py, lo, hi)
+    if sx >= sy:
+        (y0, yp), _ = fit_lines(py, max(lo, 0.75 * xp), min(hi, xp / 0.75))
+    else:
+        (x0, xp), _ = fit_lines(px, max(lo, 0.75 * yp), min(hi, yp / 0.75))
+    x1, y1 = x0 + 8 * xp, y0 + 8 * yp
+    area = np.float32([[x0, y0], [x1, y0], [x1, y1], [x0, y1]]).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(area, np.linalg.inv(H)).reshape(4, 2)
+
+# Coordinate-descent hill climb of checker_score over the 8 corner coordinates
+def refine(gray, corners, step, min_step=0.5, inner=0.9, samples=8):
+    corners = np.array(corners, dtype=np.float32)
+    best = checker_score(gray, corners, inner, samples)
+    while step >= min_step:
+        improved = False
+        for i in range(4):
+            for j in range(2):
+                for d in (step, -step):
+                    trial = corners.copy()
+                    trial[i, j] += d
+                    s = checker_score(gray, trial, inner, samples)
+                    if s > best:
+                        best, corners, improved = s, trial, True
+                        break
+        if not improved:
+            step /= 2.0
+    return order_corners(corners), best
+
+def board_side(corners):
+    return float(np.linalg.norm(corners - np.roll(corners, 1, axis=0), axis=1).mean())
+
+# Full detection: outline candidates and grid fit on a downscaled copy, polish at full resolution
+# returns (corners in full-res pixels, confidence in [0, 1])
+def detect_corners(img, max_side=640, passes=3):
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    scale = min(1.0, max_side / max(gray.shape[:2]))
+    small_bgr = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    small = cv2.cvtColor(small_bgr, cv2.COLOR_BGR2GRAY)
+
+    candidates = []
+    for quad in quad_candidates(small_bgr):
+        # each further pass re-rectifies around the previous estimate (plus a margin), which
+        # straightens out outlines skewed by perspective or by pieces sticking out of the board
+        area = fit_grid(small, quad)
+        for _ in range(passes):
+            candidates.append(area)
+            area = fit_grid(small, inset_quad(area, -0.1))
+    grid = grid_candidate(small)
+    if grid is not None:
+        candidates.append(grid)
+    if not candidates:
+        return None, 0.0
+
+    score, best = max(((checker_score(small, c), c) for c in candidates), key=lambda sc: sc[0])
+    full = order_corners(best / scale)
+    # sub-cell polish at full resolution, steps from 1/16 of a square down to half a pixel
+    full, _ = refine(gray, full, step=board_side(full) / 128, min_step=0.5)
+    return full, checker_score(gray, full)
+
+# Tracking: start from the previous frame's corners and only refine them
+def track_corners(img, prev_corners, search=0.01):
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    prev = np.array(prev_corners, dtype=np.float32)
+    corners, _ = refine(gray, prev, step=max(1.0, search * board_side(prev)), min_step=0.5)
+    return corners, checker_score(gray, corners)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--folder", type=str, help="Folder containing input images")
+    ap.add_argument("--image", type=str, help="Single image path")
+    ap.add_argument("--out", required=True, type=str, help="Output folder (or file for --image)")
+    ap.add_argument("--track", action="store_true",
+                    help="Fixed camera: refine the previous image's corners instead of re-detecting")
+    ap.add_argument("--min-confidence", type=float, default=0.5,
+                    help="Below this checker score, fall back to manual annotation")
+    ap.add_argument("--no-manual", action="store_true", help="Skip low-confidence images instead of asking")
+    args = ap.parse_args()
+
+    if args.folder:
+        img_paths = sorted(p for p in Path(args.folder).iterdir() if p.suffix.lower() in IMG_EXTS)
+        out_paths = [Path(args.out) / f"{p.stem}.json" for p in img_paths]
+    elif args.image:
+        img_paths, out_paths = [Path(args.image)], [Path(args.out)]
+    else:
+        raise SystemExit("Provide either --folder or --image")
+    if not img_paths:
+        raise SystemExit("No images found in folder.")
+
+    prev = None
+    times, manual, skipped = [], [], []
+    for img_path, out_path in zip(img_paths, out_paths):
+        img = cv2.imread(str(img_path))
+        if img is None:
+            print(f"⚠️ Could not read {img_path}")
+            continue
+        t0 = time.perf_counter()
+        mode = "detect"
+        corners, conf = None, 0.0
+        if args.track and prev is not None:
+            corners, conf = track_corners(img, prev)
+            mode = "track"
+        if conf < args.min_confidence:
+            corners, conf = detect_corners(img)
+            mode = "detect" if mode == "detect" else "track→detect"
+        dt = time.perf_counter() - t0
+        times.append(dt)
+
+        if corners is not None and conf >= args.min_confidence:
+            save_corners(corners, out_path)
+            prev = corners
+            print(f"✅ {img_path.name}: {mode}, confidence {conf:.2f}, {dt * 1000:.0f} ms → {out_path}")
+        elif args.no_manual:
+            skipped.append(img_path.name)
+            print(f"⚠️ {img_path.name}: confidence {conf:.2f} too low, skipped ({dt * 1000:.0f} ms)")
+        else:
+            from .annotate_corners import annotate_image
+            print(f"⚠️ {img_path.name}: confidence {conf:.2f} too low, annotate manually")
+            manual.append(img_path.name)
+            if annotate_image(img_path, out_path) == "quit":
+                break
+            prev = None
+
+    if times:
+        ms = np.array(times) * 1000.0
+        print(f"\nDetection latency: mean {ms.mean():.0f} ms, p50 {np.percentile(ms, 50):.0f} ms, "
+              f"max {ms.max():.0f} ms over {len(ms)} images")
+    if manual:
+        print(f"Annotated manually: {len(manual)}")
+        cv2.destroyAllWindows()
+    if skipped:
+        print(f"Skipped (low confidence): {', '.join(skipped)}")
+
+if __name__ == "__main__":
+    main()
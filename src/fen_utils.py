@@ -52,5 +52,6 @@ def grid_to_fen_placement(grid_labels):
 # full FEN string
 # havent actually implemented stuff like castling, en passant, etc
 # and im not sure if thats possible from still-frames alone
+# (infer_game.py tracks them over an ordered sequence of photos of one game)
 def full_fen_from_placement(placement, side_to_move="w", castling="-", ep="-", halfmove="0", fullmove="1"):
     return f"{placement} {side_to_move} {castling} {ep} {halfmove} {fullmove}"
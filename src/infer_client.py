@@ -0,0 +1,57 @@
+"""
+infer_client.py
+Minimal client for infer_server.py: sends one image + its corner JSON, prints the FEN.
+Also used by load_test.py.
+"""
+
+import argparse, base64, http.client, json, socket
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    # http.client over a Unix domain socket
+    def __init__(self, path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+def connect(host="127.0.0.1", port=8765, unix=None, timeout=60):
+    if unix:
+        return UnixHTTPConnection(unix, timeout=timeout)
+    return http.client.HTTPConnection(host, port, timeout=timeout)
+
+def request(conn, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else None
+    headers = {"Content-Type": "application/json"} if body else {}
+    conn.request(method, path, body=body, headers=headers)
+    resp = conn.getresponse()
+    data = json.loads(resp.read())
+    if resp.status != 200:
+        raise RuntimeError(f"{resp.status}: {data.get('error')}")
+    return data
+
+def predict_payload(image_path, corners_path, flip180=False):
+    with open(image_path, "rb") as f:
+        image_b64 = base64.b64encode(f.read()).decode("ascii")
+    return {"image": image_b64, "corners": json.load(open(corners_path)), "flip180": flip180}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--image", required=True, type=str)
+    ap.add_argument("--corners", required=True, type=str)
+    ap.add_argument("--host", type=str, default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--unix", type=str, help="Unix socket path of the server")
+    ap.add_argument("--flip180", action="store_true", help="force 180° flip if needed")
+    args = ap.parse_args()
+
+    conn = connect(args.host, args.port, args.unix)
+    result = request(conn, "POST", "/predict", predict_payload(args.image, args.corners, args.flip180))
+    print("FEN (placement):", result["placement"])
+    print("FEN (full)     :", result["fen"])
+    print(f"latency: {result['latency_ms']:.1f} ms (batch of {result['batch_size']})")
+
+if __name__ == "__main__":
+    main()
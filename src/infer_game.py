@@ -0,0 +1,263 @@
+"""
+infer_game.py
+Follow one game through an ordered sequence of photos (fixed camera, or corners per photo)
+and write it as a PGN, with the real side to move, castling rights and en-passant square
+that still frames can't show (fen_utils.full_fen_from_placement fills in "w - - 0 1").
+The current chess.Board is kept between frames. Each new frame is compared with the last
+accepted one square by square (gray thumbnails), and only the squares that changed are
+classified. Every legal move (or pair of moves, --max-plies 2) whose touched squares all
+changed is scored by the classifier's probability of the position it would leave on the
+changed squares; the best one is played if every changed square agrees with it
+(--min-prob), otherwise the frame is rejected as an impossible reading and the board is
+kept. Frames with too many changed squares (a hand over the board) are skipped.
+    python -m src.infer_game --folder game_imgs --corners data/corners/game.json `
+        --model models/classifier.keras --out game.pgn
+"""
+
+import argparse, datetime, time, numpy as np, cv2, chess, chess.pgn
+from pathlib import Path
+from .warp import warp_squares
+from .squares import a1_is_dark, squares_batch
+from .fen_utils import PIECE_CODE
+from .decode import decode_for_boards
+from .infer_image import IMG_EXTS, load_classifier, load_corners, predict_crops
+from .profiling import stage, count, add_profile_args, start_profiling, finish_profiling
+
+SYMBOL_LABEL = {code: label for label, code in PIECE_CODE.items()}
+
+# grid index r*8+c (r=0 => rank 8, same order as FEN) <-> python-chess square
+def grid_square(i):
+    return chess.square(i % 8, 7 - i // 8)
+
+def grid_index(square):
+    return (7 - chess.square_rank(square)) * 8 + chess.square_file(square)
+
+# Class label the classifier should output for a square of this board
+def square_label(board, i):
+    piece = board.piece_at(grid_square(i))
+    return "empty" if piece is None else SYMBOL_LABEL[piece.symbol()]
+
+# Grid indices whose contents differ between two boards
+def touched(before, after):
+    return {i for i in range(64) if before.piece_at(grid_square(i)) != after.piece_at(grid_square(i))}
+
+# Move sequences (up to max_plies long) from `board` whose touched squares all lie in `changed`
+def candidate_lines(board, changed, max_plies=1):
+    lines = []
+    def search(line, before):
+        if line:
+            lines.append(list(line))
+        if len(line) == max_plies:
+            return
+        # every move empties its from-square, so only pieces on changed squares can have moved
+        for move in [m for m in board.legal_moves if grid_index(m.from_square) in changed]:
+            board.push(move)
+            after = board.copy(stack=False)
+            if touched(before, after) <= changed:
+                line.append(move)
+                search(line, after)
+                line.pop()
+            board.pop()
+    search([], board.copy(stack=False))
+    return lines
+
+# Score a move sequence by the changed squares' probabilities of the position it leads to:
+# (mean log-probability, lowest single-square probability)
+def score_line(board, line, squares, probs, class_index):
+    after = board.copy(stack=False)
+    for move in line:
+        after.push(move)
+    p = np.array([probs[k, class_index[square_label(after, i)]] for k, i in enumerate(squares)])
+    return float(np.log(np.clip(p, 1e-6, 1.0)).mean()), float(p.min())
+
+# Gray thumbnails of the 64 crops, compared frame to frame to find the squares that changed
+def thumbnails(crops, thumb=16):
+    return np.stack([cv2.resize(cv2.cvtColor(c, cv2.COLOR_BGR2GRAY), (thumb, thumb),
+                                interpolation=cv2.INTER_AREA) for c in crops]).astype(np.float32)
+
+# Corners for a photo: --corners (fixed camera), else --corners-dir/<stem>.json
+def frame_corners(args, img_path):
+    if args.corners:
+        return Path(args.corners)
+    return Path(args.corners_dir) / f"{img_path.stem}.json"
+
+# (image_path, corners_path) per photo, in game order
+# --manifest: CSV lines of image_path[,corners_path]; without the column, as for --folder
+def collect_frames(args):
+    if args.manifest:
+        rows = []
+        with open(args.manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    img_path, _, corners_path = line.partition(",")
+                    img_path = Path(img_path.strip())
+                    rows.append((img_path, Path(corners_path.strip()) if corners_path.strip() else None))
+    else:
+        rows = [(p, None) for p in sorted(Path(args.folder).iterdir()) if p.suffix.lower() in IMG_EXTS]
+    frames = []
+    for img_path, corners_path in rows:
+        corners_path = corners_path or frame_corners(args, img_path)
+        if not corners_path.exists():
+            print(f"⚠️ Missing corners for {img_path.name}, skipping.")
+            continue
+        frames.append((img_path, corners_path))
+    return frames
+
+class GameTracker:
+    def __init__(self, model, class_names, start_fen=chess.STARTING_FEN, img_size=96, flip180=False,
+                 threshold=12.0, max_changed=8, max_plies=1, min_prob=0.3, reduce=True):
+        self.model = model
+        self.class_index = {name: i for i, name in enumerate(class_names)}
+        self.board = chess.Board(start_fen)
+        self.img_size = img_size
+        self.flip = flip180 or None  # decided on the first frame, then kept (pieces move, the board doesn't)
+        self.threshold = threshold
+        self.max_changed = max_changed
+        self.max_plies = max_plies
+        self.min_prob = min_prob
+        self.reduce = reduce
+        self.reference = None  # thumbnails of the last accepted frame
+        self.game = chess.pgn.Game()
+        self.game.setup(self.board)
+        self.node = self.game
+        self.classified = 0
+        self.frames = 0
+
+    # 64 oriented uint8 crops of one photo
+    def crops(self, img_path, corners):
+        with stage("imread"):
+            img, scale = decode_for_boards(img_path, [corners], self.img_size, reduce=self.reduce)
+        if img is None:
+            return None
+        with stage("warp_squares"):
+            crops = warp_squares(img, corners * scale, img_size=self.img_size, pad=2)
+        grid = crops.reshape(8, 8, *crops.shape[1:])
+        if self.flip is None:
+            self.flip = not a1_is_dark(grid)
+        # apply the stored decision (orient_grid would re-run the a1 check on every frame)
+        return squares_batch(grid[::-1, ::-1, ::-1, ::-1] if self.flip else grid)
+
+    def classify(self, crops, squares):
+        self.classified += len(squares)
+        count("squares_classified", len(squares))
+        return predict_crops(self.model, crops[squares], batch_crops=64)
+
+    # First frame: becomes the reference; the full classification is only a check of --start-fen
+    def start(self, crops):
+        probs = self.classify(crops, list(range(64)))
+        agree = sum(probs[i].argmax() == self.class_index[square_label(self.board, i)] for i in range(64))
+        self.reference = thumbnails(crops)
+        return agree
+
+    # One frame -> (status, moves played, changed grid squares)
+    # status: "same", "move", "occluded" or "rejected"
+    def update(self, crops):
+        with stage("diff"):
+            thumbs = thumbnails(crops)
+            diff = np.abs(thumbs - self.reference).mean(axis=(1, 2))
+            changed = [int(i) for i in np.flatnonzero(diff > self.threshold)]
+        if not changed:
+            return "same", [], changed
+        if len(changed) > self.max_changed:
+            return "occluded", [], changed
+        probs = self.classify(crops, changed)
+        with stage("match"):
+            # "no move" is a candidate too: lighting or a nudged piece changes squares without a move
+            lines = [[]] + candidate_lines(self.board, set(changed), self.max_plies)
+            scored = [(score_line(self.board, line, changed, probs, self.class_index), line) for line in lines]
+            (_, min_p), best = max(scored, key=lambda s: s[0][0])
+        if min_p < self.min_prob:
+            return "rejected", [], changed
+        for move in best:
+            self.node = self.node.add_variation(move)
+            self.board.push(move)
+        self.reference = thumbs
+        return ("move" if best else "same"), best, changed
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--folder", type=str, help="Photos of one game, in order (sorted by file name)")
+    ap.add_argument("--manifest", type=str, help="CSV of image_path[,corners_path] per line, in game order")
+    ap.add_argument("--corners", type=str, help="One corners JSON for every photo (fixed camera)")
+    ap.add_argument("--corners-dir", type=str, help="Or a corners JSON per photo (<stem>.json)")
+    ap.add_argument("--model", required=True, type=str)
+    ap.add_argument("--out", type=str, default="game.pgn", help="Output PGN")
+    ap.add_argument("--start-fen", type=str, default=chess.STARTING_FEN, help="Position in the first photo")
+    ap.add_argument("--img-size", type=int, default=96)
+    ap.add_argument("--flip180", action="store_true", help="force 180° flip if needed")
+    ap.add_argument("--full-decode", action="store_true", help="Always decode photos at full resolution")
+    ap.add_argument("--threshold", type=float, default=12.0,
+                    help="Mean gray-level difference above which a square counts as changed")
+    ap.add_argument("--max-changed", type=int, default=8, help="Skip frames with more changed squares (occlusion)")
+    ap.add_argument("--max-plies", type=int, default=1, choices=[1, 2], help="Moves allowed between two photos")
+    ap.add_argument("--min-prob", type=float, default=0.3,
+                    help="Reject a frame if any changed square gives the best move's result less than this")
+    ap.add_argument("--event", type=str, default="?", help="PGN Event header")
+    add_profile_args(ap)
+    args = ap.parse_args()
+
+    start_profiling(args)
+    try:
+        run(args)
+    finally:
+        finish_profiling(args)
+
+def run(args):
+    if not (args.folder or args.manifest):
+        raise SystemExit("Provide --folder or --manifest")
+    if not (args.corners or args.corners_dir):
+        raise SystemExit("Provide --corners (fixed camera) or --corners-dir")
+    try:
+        chess.Board(args.start_fen)
+    except ValueError as e:
+        raise SystemExit(f"Bad --start-fen: {e}")
+    frames = collect_frames(args)
+    if not frames:
+        raise SystemExit("No photos with corners found.")
+
+    with stage("load_model"):
+        model, class_names = load_classifier(args.model)
+    tracker = GameTracker(model, class_names, args.start_fen, args.img_size, args.flip180, args.threshold,
+                          args.max_changed, args.max_plies, args.min_prob, reduce=not args.full_decode)
+    t_start = time.perf_counter()
+    for img_path, corners_path in frames:
+        crops = tracker.crops(img_path, load_corners(corners_path))
+        if crops is None:
+            print(f"⚠️ Could not read image {img_path}")
+            continue
+        tracker.frames += 1
+        if tracker.reference is None:
+            agree = tracker.start(crops)
+            print(f"{img_path.name}: start position, classifier agrees on {agree}/64 squares")
+            if agree < 48:
+                print("⚠️ First photo doesn't look like --start-fen (or the corners / model are off)")
+            continue
+        status, moves, changed = tracker.update(crops)
+        squares = " ".join(chess.square_name(grid_square(i)) for i in changed)
+        if status == "move":
+            tracker.node.comment = img_path.name
+            print(f"{img_path.name}: {' '.join(m.uci() for m in moves)} → {tracker.board.fen()}")
+        elif status == "same":
+            print(f"{img_path.name}: no move" + (f" (changed: {squares})" if changed else ""))
+        elif status == "occluded":
+            print(f"⚠️ {img_path.name}: {len(changed)} squares changed, board occluded? skipped")
+        else:
+            print(f"⚠️ {img_path.name}: no legal move explains changed squares {squares}, reading rejected")
+    elapsed = time.perf_counter() - t_start
+
+    game = tracker.game
+    game.headers["Event"] = args.event
+    game.headers["Date"] = datetime.date.today().strftime("%Y.%m.%d")
+    game.headers["Result"] = tracker.board.result(claim_draw=False)
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.out, "w") as f:
+        print(game, file=f, end="\n\n")
+    full = 64 * tracker.frames
+    print(f"✅ {tracker.frames} photos, {len(tracker.board.move_stack)} moves in {elapsed:.2f}s "
+          f"({tracker.frames / max(elapsed, 1e-9):.1f} photos/s); classified {tracker.classified}/{full} squares "
+          f"({100 * tracker.classified / max(full, 1):.0f}%) → {args.out}")
+    print("Final FEN:", tracker.board.fen())
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,335 @@
-import argparse, json, numpy as np, cv2, tensorflow as tf
+"""
+infer_image.py
+Predict the FEN piece placement of chessboard photos with a trained classifier
+(.keras, .tflite or .onnx, see backends.py; TensorFlow is only imported for .keras).
+Single mode: one --image / --corners pair, prints the FEN.
+Batch mode: many images from --folder, --glob or --manifest. The model is loaded once,
+crops from many boards are packed into fixed-size predict batches, and one FEN per
+image is written to a CSV or JSONL file along with boards/sec throughput.
+--cache reuses per-square predictions for squares unchanged since earlier photos (square_cache.py).
+--catalog returns stored FENs for photos already predicted with the same model, corners and
+settings without decoding them, and stores new ones (catalog.py).
+Photos are decoded at the smallest JPEG reduction that still covers the crops (decode.py).
+Multi-board photos: a corners file may list several boards (see load_boards); the photo is
+decoded once, all N x 64 crops go through one predict call and one FEN is returned per board id.
+"""
+
+import argparse, csv, glob, json, time, numpy as np
 from pathlib import Path
-from .warp import warp_board
-from .squares import split_squares, maybe_flip_180
-from .fen_utils import LABELS, grid_to_fen_placement, full_fen_from_placement
+from .warp import warp_squares
+from .squares import maybe_flip_squares
+from .fen_utils import grid_to_fen_placement, full_fen_from_placement
+from .backends import load_backend, load_class_names
+from .square_cache import SquareCache, model_signature
+from .catalog import Catalog, corners_text
+from .decode import decode_for_boards, pick_factor
+from .profiling import stage, count, add_profile_args, start_profiling, finish_profiling
+
+IMG_EXTS = [".jpg", ".jpeg", ".png", ".bmp"]
+
+# Load the model once (backend picked by file extension, see backends.py),
+# plus its class order (saved next to it by train_classifier.py)
+def load_classifier(model_path, threads=None, inter_threads=None):
+    return load_backend(model_path, threads=threads, inter_threads=inter_threads), load_class_names(model_path)
+
+# Warp one photo and return its 64 square crops as a uint8 (64, img_size, img_size, 3) batch
+def board_batch(img, corners, img_size=96, flip180=False):
+    with stage("warp_squares"):
+        crops = warp_squares(img, corners, img_size=img_size, pad=2)
+    with stage("flip"):
+        return maybe_flip_squares(crops, force_flip=flip180)
+
+# Map (64, num_classes) probabilities to placement + full FEN strings
+def fen_from_probs(probs, class_names):
+    count("boards")
+    ids = probs.argmax(axis=1).tolist()
+    pred_labels = [class_names[i] for i in ids]
+    placement = grid_to_fen_placement(pred_labels)
+    full_fen = full_fen_from_placement(placement, side_to_move="w", castling="-", ep="-", halfmove="0", fullmove="1")
+    return placement, full_fen
+
+def load_corners(corners_path):
+    return np.array(json.load(open(corners_path)), dtype=np.float32)
+
+# Boards in a corners file as [(board_id, corners), ...]
+# - one board: the usual list of 4 [x, y] points -> board_id None
+# - several boards: {"<board_id>": [4 points], ...} or a list of 4-point lists (ids "0", "1", ...)
+def load_boards(corners_path):
+    data = json.load(open(corners_path))
+    if isinstance(data, dict):
+        return [(str(k), np.array(v, dtype=np.float32)) for k, v in data.items()]
+    pts = np.array(data, dtype=np.float32)
+    if pts.ndim == 2:
+        return [(None, pts)]
+    return [(str(i), b) for i, b in enumerate(pts)]
+
+# All boards of one decoded photo as a single uint8 (N*64, img_size, img_size, 3) batch
+def boards_batch(img, boards, img_size=96, flip180=False):
+    return np.concatenate([board_batch(img, corners, img_size, flip180) for _, corners in boards], axis=0)
+
+# Collect (image_path, corners_path) jobs for batch mode
+# --manifest: CSV lines of image_path,corners_path
+# --folder / --glob: corners are looked up as <corners-dir>/<image stem>.json
+def collect_jobs(args):
+    jobs = []
+    if args.manifest:
+        for line in open(args.manifest):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                img_path, corners_path = line.split(",", 1)
+            except ValueError:
+                print(f"⚠️ Skipping malformed line: {line}")
+                continue
+            jobs.append((Path(img_path.strip()), Path(corners_path.strip())))
+        return jobs
+
+    if args.folder:
+        img_paths = sorted(Path(args.folder).glob("*"))
+    else:
+        img_paths = sorted(Path(p) for p in glob.glob(args.glob, recursive=True))
+    corners_dir = Path(args.corners_dir)
+    for img_path in img_paths:
+        if img_path.suffix.lower() not in IMG_EXTS:
+            continue
+        corners_path = corners_dir / f"{img_path.stem}.json"
+        if not corners_path.exists():
+            print(f"⚠️ Missing corners for {img_path.name}, skipping.")
+            continue
+        jobs.append((img_path, corners_path))
+    return jobs
+
+# Catalog key of a photo + its corners + the JPEG reduction it will be decoded at (decode.pick_factor,
+# 1 with reduce=False), and the stored {board: (placement, fen)} if every board has one
+def catalog_lookup(catalog, img_path, corners_path, boards, model_sig, img_size, flip180, reduce=True):
+    with stage("catalog"):
+        factor = pick_factor([c for _, c in boards], img_size) if reduce else 1
+        key = (catalog.image_hash(img_path), corners_text(corners_path), factor)
+        return key, catalog.get_predictions(*key, [b for b, _ in boards], model_sig, img_size, flip180)
+
+class ResultWriter:
+    # Writes one row per image to .csv or .jsonl (picked by file extension)
+    FIELDS = ["image", "board", "placement", "fen", "seconds"]
+
+    def __init__(self, out_path):
+        out_path = Path(out_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        self.jsonl = out_path.suffix.lower() in [".jsonl", ".json"]
+        self.f = open(out_path, "w", newline="")
+        if not self.jsonl:
+            self.csv = csv.DictWriter(self.f, fieldnames=self.FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.jsonl:
+            self.f.write(json.dumps(row) + "\n")
+        else:
+            self.csv.writerow(row)
+
+    def close(self):
+        self.f.close()
+
+# Run uint8 crops through the model in chunks of at most batch_crops, zero-padding each
+# chunk to a power-of-two size so the model only ever sees a handful of input shapes
+def predict_crops(model, crops, batch_crops=1024):
+    out = []
+    for i in range(0, len(crops), batch_crops):
+        chunk = crops[i:i+batch_crops]
+        n = len(chunk)
+        size = min(batch_crops, 1 << (n - 1).bit_length())
+        buf = np.zeros((size, *chunk.shape[1:]), dtype=np.float32)
+        buf[:n] = chunk.astype(np.float32) / 255.0
+        with stage("predict"):
+            out.append(model.predict(buf)[:n])
+        count("batches")
+        count("squares", n)
+    return np.concatenate(out, axis=0)
+
+# Batch mode: stream images through warp_squares -> flip, pack the crops of
+# `batch_boards` boards into one fixed-size predict batch, write one FEN per board
+# (a multi-board photo is decoded once and contributes all its boards to the batch)
+# With a SquareCache, only crops that miss the cache are sent to the model
+# With a Catalog (+ model signature), photos predicted before are answered from it
+def run_batch(jobs, model, class_names, writer, img_size=96, batch_boards=16, flip180=False, cache=None,
+              reduce=True, catalog=None, model_sig=None):
+    batch_crops = batch_boards * 64
+    pending = []  # (image_path, board_id, preprocess seconds, crops, catalog key) for boards waiting for predict
+
+    def emit(img_path, board_id, placement, full_fen, seconds):
+        with stage("write"):
+            writer.write({"image": str(img_path), "board": board_id, "placement": placement,
+                          "fen": full_fen, "seconds": round(seconds, 4)})
+        name = img_path.name if board_id is None else f"{img_path.name}[{board_id}]"
+        print(f"{name}: {placement}  ({1.0 / max(seconds, 1e-9):.1f} boards/s)")
+
+    def predict_fn(crops):
+        return predict_crops(model, crops, batch_crops)
+
+    def flush():
+        t0 = time.perf_counter()
+        crops = np.concatenate([c for _, _, _, c, _ in pending], axis=0)
+        probs = cache.predict(crops, predict_fn) if cache else predict_fn(crops)
+        predict_s = (time.perf_counter() - t0) / len(pending)
+        for i, (img_path, board_id, prep_s, _, key) in enumerate(pending):
+            with stage("fen"):
+                placement, full_fen = fen_from_probs(probs[i*64:(i+1)*64], class_names)
+            emit(img_path, board_id, placement, full_fen, prep_s + predict_s)
+            if catalog:
+                catalog.put_prediction(*key, board_id, model_sig, img_size, flip180, img_path, placement, full_fen)
+        if catalog:
+            catalog.commit()
+        pending.clear()
+
+    done = 0
+    t_start = time.perf_counter()
+    for img_path, corners_path in jobs:
+        t0 = time.perf_counter()
+        boards = load_boards(corners_path)
+        key = None
+        if catalog:
+            key, stored = catalog_lookup(catalog, img_path, corners_path, boards, model_sig, img_size, flip180,
+                                         reduce)
+            if stored:
+                seconds = (time.perf_counter() - t0) / len(boards)
+                for board_id, _ in boards:
+                    emit(img_path, board_id, *stored[board_id or ""], seconds)
+                done += len(boards)
+                continue
+        with stage("imread"):
+            img, scale = decode_for_boards(img_path, [c for _, c in boards], img_size, reduce=reduce)
+        if img is None:
+            print(f"⚠️ Could not read image {img_path}")
+            continue
+        count("images")
+        crops = boards_batch(img, [(b, c * scale) for b, c in boards], img_size, flip180)
+        # decode + warp time shared evenly by the boards of this photo
+        prep_s = (time.perf_counter() - t0) / len(boards)
+        for i, (board_id, _) in enumerate(boards):
+            pending.append((img_path, board_id, prep_s, crops[i*64:(i+1)*64], key))
+        done += len(boards)
+        if len(pending) >= batch_boards:
+            flush()
+    if pending:
+        flush()
+
+    elapsed = time.perf_counter() - t_start
+    return done, elapsed
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--image", required=True, type=str)
-    ap.add_argument("--corners", required=True, type=str)
+    ap.add_argument("--image", type=str, help="Single image path")
+    ap.add_argument("--corners", type=str, help="Path to its corner JSON (one board, or several: see load_boards)")
+    ap.add_argument("--folder", type=str, help="Batch mode: folder with input images")
+    ap.add_argument("--glob", type=str, help="Batch mode: glob pattern for input images")
+    ap.add_argument("--corners-dir", type=str, help="Batch mode: folder with corner JSONs (<stem>.json)")
+    ap.add_argument("--manifest", type=str, help="Batch mode: CSV of image_path,corners_path per line")
+    ap.add_argument("--out", type=str, help="Batch mode: output .csv or .jsonl file")
+    ap.add_argument("--batch-boards", type=int, default=16, help="Boards (x64 crops) per predict batch")
     ap.add_argument("--model", required=True, type=str)
     ap.add_argument("--img-size", type=int, default=96)
     ap.add_argument("--flip180", action="store_true", help="force 180° flip if needed")
+    ap.add_argument("--full-decode", action="store_true", help="Always decode photos at full resolution")
+    ap.add_argument("--cache", type=str, help="Per-square prediction cache file (.npz), reused across runs")
+    ap.add_argument("--cache-tolerance", type=int, default=8,
+                    help="Gray-level step below which a square counts as unchanged")
+    ap.add_argument("--catalog", type=str, help="SQLite catalog (catalog.py): reuse/store predictions per photo")
+    add_profile_args(ap)
     args = ap.parse_args()
 
-    img = cv2.imread(args.image)
-    if img is None:
-        raise SystemExit(f"Could not read image: {args.image}")
-    corners = np.array(json.load(open(args.corners)), dtype=np.float32)
+    start_profiling(args)
+    try:
+        run(args)
+    finally:
+        finish_profiling(args)
 
-    model = tf.keras.models.load_model(args.model)
-    classes_path = Path(args.model).with_suffix(".classes.json")
-    if classes_path.exists():
-        class_names = json.load(open(classes_path))
-    else:
-        class_names = LABELS
+def run(args):
+    # Option B — batch mode
+    if args.folder or args.glob or args.manifest:
+        if not args.out:
+            raise SystemExit("For batch mode, supply --out (.csv or .jsonl)")
+        if not args.manifest and not args.corners_dir:
+            raise SystemExit("For --folder / --glob, supply --corners-dir")
+        jobs = collect_jobs(args)
+        if not jobs:
+            raise SystemExit("No images with corners found.")
+        catalog = Catalog(args.catalog) if args.catalog else None
+        model_sig = model_signature(args.model) if catalog else None
+        model, class_names = None, None
+        # skip the model load entirely when the catalog already has every photo
+        if not (catalog and all(catalog_lookup(catalog, img, c, load_boards(c), model_sig, args.img_size,
+                                               args.flip180, not args.full_decode)[1] for img, c in jobs)):
+            with stage("load_model"):
+                model, class_names = load_classifier(args.model)
+        cache = SquareCache(args.cache, args.model, tolerance=args.cache_tolerance) if args.cache else None
+        writer = ResultWriter(args.out)
+        try:
+            done, elapsed = run_batch(jobs, model, class_names, writer, img_size=args.img_size,
+                                      batch_boards=args.batch_boards, flip180=args.flip180, cache=cache,
+                                      reduce=not args.full_decode, catalog=catalog, model_sig=model_sig)
+        finally:
+            writer.close()
+            if cache:
+                cache.save()
+            if catalog:
+                catalog.close()
+        print(f"✅ {done} boards in {elapsed:.2f}s ({done / max(elapsed, 1e-9):.1f} boards/s) → {args.out}")
+        if cache:
+            print(cache.summary())
+        return
 
-    topdown, _ = warp_board(img, corners, out_size=800)
-    topdown = maybe_flip_180(topdown, force_flip=args.flip180)
-    crops = split_squares(topdown, pad=2)
+    # Option A — single image mode
+    if not (args.image and args.corners):
+        raise SystemExit("Provide --image and --corners, or --folder/--glob/--manifest with --out")
+    boards = load_boards(args.corners)
+    catalog = Catalog(args.catalog) if args.catalog else None
+    if catalog:
+        # a photo predicted before with this model: no decode, no model load
+        model_sig = model_signature(args.model)
+        key, stored = catalog_lookup(catalog, args.image, args.corners, boards, model_sig, args.img_size, args.flip180,
+                                     not args.full_decode)
+        if stored:
+            for board_id, _ in boards:
+                if board_id is not None:
+                    print(f"[board {board_id}]")
+                print("FEN (placement):", stored[board_id or ""][0])
+                print("FEN (full)     :", stored[board_id or ""][1])
+            print("(from catalog)")
+            catalog.close()
+            return
+    with stage("imread"):
+        img, scale = decode_for_boards(args.image, [c for _, c in boards], args.img_size,
+                                       reduce=not args.full_decode)
+    if img is None:
+        raise SystemExit(f"Could not read image: {args.image}")
+    boards = [(b, c * scale) for b, c in boards]
 
-    batch = np.stack([cv2.resize(c, (args.img_size, args.img_size)) for c in crops], axis=0)
-    batch = batch.astype(np.float32)/255.0
-    probs = model.predict(batch, verbose=0)
-    ids = probs.argmax(axis=1).tolist()
-    pred_labels = [class_names[i] for i in ids]
+    with stage("load_model"):
+        model, class_names = load_classifier(args.model)
 
-    placement = grid_to_fen_placement(pred_labels)
-    full_fen = full_fen_from_placement(placement, side_to_move="w", castling="-", ep="-", halfmove="0", fullmove="1")
-    print("FEN (placement):", placement)
-    print("FEN (full)     :", full_fen)
+    # all boards of the photo in one predict call
+    batch = boards_batch(img, boards, args.img_size, args.flip180)
+    if args.cache:
+        cache = SquareCache(args.cache, args.model, tolerance=args.cache_tolerance)
+        probs = cache.predict(batch, lambda crops: predict_crops(model, crops, len(crops)))
+        cache.save()
+    else:
+        batch = batch.astype(np.float32)/255.0
+        with stage("predict"):
+            probs = model.predict(batch)
+    for i, (board_id, _) in enumerate(boards):
+        placement, full_fen = fen_from_probs(probs[i*64:(i+1)*64], class_names)
+        if board_id is not None:
+            print(f"[board {board_id}]")
+        print("FEN (placement):", placement)
+        print("FEN (full)     :", full_fen)
+        if catalog:
+            catalog.put_prediction(*key, board_id, model_sig, args.img_size, args.flip180, args.image,
+                                   placement, full_fen)
+    if catalog:
+        catalog.close()
+    if args.cache:
+        print(cache.summary())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,221 @@
+"""
+infer_parallel.py
+Batch inference for many-core machines: preprocessing runs in worker processes, the model in one.
+    workers (N processes): decode (reduced unless --full-decode) -> warp_squares -> flip -> shared-memory ring
+    consumer (this process): gathers full batches of boards from the ring -> model.predict -> FENs
+The ring is one multiprocessing.shared_memory block of --slots board slots (64 crops each).
+Only small tuples (job index, board id, slot number) travel through the queues, so image and
+crop arrays are never pickled between processes. A slot goes back to the workers as soon as
+its crops are copied into the predict batch, so workers keep decoding while the model runs.
+Same inputs/outputs as infer_image batch mode (--folder/--glob/--manifest, --out .csv/.jsonl);
+rows are written in completion order.
+"""
+
+import argparse, os, queue, time, numpy as np, cv2
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from .infer_image import (load_classifier, load_boards, boards_batch, fen_from_probs,
+                          collect_jobs, ResultWriter)
+from .decode import decode_for_boards
+from .profiling import stage, count, add_profile_args, start_profiling, finish_profiling
+
+def ring_view(shm, slots, img_size):
+    return np.ndarray((slots, 64, img_size, img_size, 3), dtype=np.uint8, buffer=shm.buf)
+
+# Worker process: decode + warp jobs, write each board into a free ring slot
+# Messages to the consumer: ("board", job_idx, board_id, slot, prep_seconds),
+# ("error", job_idx, message), and finally ("done", worker_id, images, busy_seconds)
+def worker(worker_id, shm_name, slots, img_size, flip180, reduce, jobs, job_q, free_q, ready_q):
+    cv2.setNumThreads(1)  # parallelism comes from the processes, not OpenCV's pool
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = ring_view(shm, slots, img_size)
+    images, busy = 0, 0.0
+    try:
+        while True:
+            job_idx = job_q.get()
+            if job_idx is None:
+                break
+            img_path, corners_path = jobs[job_idx]
+            t0 = time.perf_counter()
+            boards = load_boards(corners_path)
+            img, scale = decode_for_boards(img_path, [c for _, c in boards], img_size, reduce=reduce)
+            if img is None:
+                ready_q.put(("error", job_idx, f"Could not read image {img_path}"))
+                continue
+            crops = boards_batch(img, [(b, c * scale) for b, c in boards], img_size, flip180)
+            del img
+            prep_s = (time.perf_counter() - t0) / len(boards)
+            busy += time.perf_counter() - t0
+            images += 1
+            for i, (board_id, _) in enumerate(boards):
+                slot = free_q.get()  # blocks while the consumer is behind
+                ring[slot] = crops[i*64:(i+1)*64]
+                ready_q.put(("board", job_idx, board_id, slot, prep_s))
+    finally:
+        del ring
+        shm.close()
+        ready_q.put(("done", worker_id, images, busy))
+
+class Consumer:
+    # Pulls boards out of the ring in batches of up to batch_boards, predicts, writes FENs
+    def __init__(self, model, class_names, writer, jobs, ring, free_q, batch_boards, max_wait):
+        self.model = model
+        self.class_names = class_names
+        self.writer = writer
+        self.jobs = jobs
+        self.ring = ring
+        self.free_q = free_q
+        self.batch_boards = batch_boards
+        self.max_wait = max_wait
+        self.batch = np.zeros((batch_boards * 64, *ring.shape[2:]), dtype=np.float32)
+        self.boards = 0
+        self.predict_s = 0.0
+        self.wait_s = 0.0
+
+    def flush(self, pending):
+        n = len(pending)
+        with stage("gather"):
+            for i, (_, _, slot, _) in enumerate(pending):
+                np.multiply(self.ring[slot], 1.0 / 255.0, out=self.batch[i*64:(i+1)*64], casting="unsafe")
+                self.free_q.put(slot)  # slot can be refilled while we predict
+        t0 = time.perf_counter()
+        with stage("predict"):
+            # a partial batch is padded to a power of two (as infer_image.predict_crops does),
+            # so the model only sees a handful of input sizes; padding rows are stale, and dropped
+            size = min(len(self.batch), 1 << (n * 64 - 1).bit_length())
+            probs = self.model.predict(self.batch[:size])[:n * 64]
+        self.predict_s += time.perf_counter() - t0
+        count("batches")
+        count("squares", n * 64)
+        per_board = (time.perf_counter() - t0) / n
+        for i, (job_idx, board_id, _, prep_s) in enumerate(pending):
+            with stage("fen"):
+                placement, full_fen = fen_from_probs(probs[i*64:(i+1)*64], self.class_names)
+            img_path = self.jobs[job_idx][0]
+            with stage("write"):
+                self.writer.write({"image": str(img_path), "board": board_id, "placement": placement,
+                                   "fen": full_fen, "seconds": round(prep_s + per_board, 4)})
+        self.boards += n
+
+    def run(self, ready_q, n_workers):
+        pending, done, stats = [], 0, []
+        while done < n_workers:
+            # wait for the first board of a batch, then top the batch up until it is full
+            # or nothing new arrives within max_wait
+            t0 = time.perf_counter()
+            try:
+                msg = ready_q.get(timeout=self.max_wait if pending else None)
+            except queue.Empty:
+                msg = None
+            if not pending:
+                self.wait_s += time.perf_counter() - t0
+            if msg is None:
+                self.flush(pending)
+                pending = []
+                continue
+            if msg[0] == "board":
+                pending.append(msg[1:])
+                if len(pending) == self.batch_boards:
+                    self.flush(pending)
+                    pending = []
+            elif msg[0] == "error":
+                print(f"⚠️ {msg[2]}")
+            elif msg[0] == "done":
+                done += 1
+                stats.append(msg[1:])
+        if pending:
+            self.flush(pending)
+        return sorted(stats)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--folder", type=str, help="Folder with input images")
+    ap.add_argument("--glob", type=str, help="Glob pattern for input images")
+    ap.add_argument("--corners-dir", type=str, help="Folder with corner JSONs (<stem>.json)")
+    ap.add_argument("--manifest", type=str, help="CSV of image_path,corners_path per line")
+    ap.add_argument("--out", required=True, type=str, help="Output .csv or .jsonl file")
+    ap.add_argument("--model", required=True, type=str)
+    ap.add_argument("--img-size", type=int, default=96)
+    ap.add_argument("--flip180", action="store_true", help="force 180° flip if needed")
+    ap.add_argument("--full-decode", action="store_true", help="Always decode photos at full resolution")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                    help="Preprocessing processes (default: all cores but one)")
+    ap.add_argument("--batch-boards", type=int, default=16, help="Boards (x64 crops) per predict batch")
+    ap.add_argument("--slots", type=int, help="Board slots in the shared ring (default: 2 batches + 1 per worker)")
+    ap.add_argument("--max-wait-ms", type=float, default=20.0,
+                    help="Predict a partial batch when no new board arrives within this time")
+    ap.add_argument("--intra-op-threads", type=int, help="Model runtime intra-op threads")
+    ap.add_argument("--inter-op-threads", type=int, help="Model runtime inter-op threads (Keras/ONNX)")
+    add_profile_args(ap)
+    args = ap.parse_args()
+
+    start_profiling(args)
+    try:
+        run(args)
+    finally:
+        finish_profiling(args)
+
+def run(args):
+    if not (args.folder or args.glob or args.manifest):
+        raise SystemExit("Provide --folder, --glob or --manifest")
+    if not args.manifest and not args.corners_dir:
+        raise SystemExit("For --folder / --glob, supply --corners-dir")
+    jobs = collect_jobs(args)
+    if not jobs:
+        raise SystemExit("No images with corners found.")
+    n_workers = max(1, min(args.workers, len(jobs)))
+    slots = args.slots or 2 * args.batch_boards + n_workers
+
+    ring_bytes = slots * 64 * args.img_size * args.img_size * 3
+    shm = shared_memory.SharedMemory(create=True, size=ring_bytes)
+    # spawn: workers start clean (no copy of the parent's model runtime), and it is what Windows uses anyway
+    ctx = mp.get_context("spawn")
+    job_q, free_q, ready_q = ctx.Queue(), ctx.Queue(), ctx.Queue()
+    for slot in range(slots):
+        free_q.put(slot)
+    for job_idx in range(len(jobs)):
+        job_q.put(job_idx)
+    for _ in range(n_workers):
+        job_q.put(None)
+
+    procs = [ctx.Process(target=worker, daemon=True,
+                         args=(w, shm.name, slots, args.img_size, args.flip180, not args.full_decode,
+                               jobs, job_q, free_q, ready_q))
+             for w in range(n_workers)]
+    ring = ring_view(shm, slots, args.img_size)
+    writer = None
+    try:
+        t_start = time.perf_counter()
+        for p in procs:
+            p.start()
+        # workers are already decoding while the model loads
+        with stage("load_model"):
+            model, class_names = load_classifier(args.model, threads=args.intra_op_threads,
+                                                 inter_threads=args.inter_op_threads)
+        writer = ResultWriter(args.out)
+        consumer = Consumer(model, class_names, writer, jobs, ring, free_q,
+                            args.batch_boards, args.max_wait_ms / 1000.0)
+        worker_stats = consumer.run(ready_q, n_workers)
+        elapsed = time.perf_counter() - t_start
+        for p in procs:
+            p.join()
+        consumer.ring = None
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        if writer:
+            writer.close()
+        del ring  # the buffer can only be released once no array views it
+        shm.close()
+        shm.unlink()
+
+    boards = consumer.boards
+    print(f"✅ {boards} boards in {elapsed:.2f}s ({boards / max(elapsed, 1e-9):.1f} boards/s) → {args.out}")
+    print(f"consumer: predict busy {100 * consumer.predict_s / max(elapsed, 1e-9):.0f}% of wall, "
+          f"waiting for workers {consumer.wait_s:.2f}s")
+    for worker_id, images, busy in worker_stats:
+        print(f"worker {worker_id}: {images} images, busy {100 * busy / max(elapsed, 1e-9):.0f}% of wall")
+
+if __name__ == "__main__":
+    main()
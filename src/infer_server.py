@@ -0,0 +1,209 @@
+"""
+infer_server.py
+Long-running local inference server. Keeps the classifier (and its .classes.json) warm and
+coalesces concurrent requests into one model.predict batch.
+Speaks minimal HTTP/1.1 over TCP (--host/--port) or a Unix socket (--unix), asyncio based.
+Endpoints:
+    POST /predict   JSON {"image": <base64 image bytes>, "corners": [[x,y] x4], "flip180": false}
+                    -> {"placement": ..., "fen": ..., "batch_size": ..., "latency_ms": ...}
+    GET  /metrics   queue depth, batch-size and latency counters
+    GET  /health
+Requests that arrive within --window-ms of the first queued one (up to --max-boards)
+share a single predict call, padded to a power-of-two number of boards.
+"""
+
+import argparse, asyncio, base64, json, time, numpy as np, cv2
+from concurrent.futures import ThreadPoolExecutor
+from .infer_image import load_classifier, board_batch, fen_from_probs, predict_crops
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self.boards = 0
+        self.max_batch = 0
+        self.batch_hist = {}  # boards per predict call -> count
+        self.latency_ms_total = 0.0
+        self.predict_ms_total = 0.0
+
+    def as_dict(self, queue_depth):
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "queue_depth": queue_depth,
+            "requests": self.requests,
+            "errors": self.errors,
+            "batches": self.batches,
+            "boards": self.boards,
+            "avg_batch_size": round(self.boards / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+            "batch_size_hist": {str(k): v for k, v in sorted(self.batch_hist.items())},
+            "avg_latency_ms": round(self.latency_ms_total / self.requests, 2) if self.requests else 0.0,
+            "avg_predict_ms": round(self.predict_ms_total / self.batches, 2) if self.batches else 0.0,
+        }
+
+class InferenceServer:
+    def __init__(self, model_path, img_size=96, window_ms=5.0, max_boards=32, workers=4):
+        self.model, self.class_names = load_classifier(model_path)
+        self.img_size = img_size
+        self.window = window_ms / 1000.0
+        self.max_boards = max_boards
+        self.metrics = Metrics()
+        self.queue = None
+        # decode + warp run on a thread pool (OpenCV releases the GIL),
+        # predict runs on its own single thread so batches never overlap
+        self.prep_pool = ThreadPoolExecutor(max_workers=workers)
+        self.predict_pool = ThreadPoolExecutor(max_workers=1)
+
+    def preprocess(self, image_bytes, corners, flip180):
+        img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("could not decode image")
+        corners = np.array(corners, dtype=np.float32)
+        return board_batch(img, corners, self.img_size, flip180)
+
+    # Micro-batches hold any number of boards; predict_crops pads them to a power of two so the
+    # model only ever sees log2(max_boards)+1 batch shapes (Keras retraces, TFLite reallocates per shape)
+    def predict(self, crops):
+        return predict_crops(self.model, crops, batch_crops=self.max_boards * 64)
+
+    # Collect requests for up to `window` seconds (or max_boards), then run one predict
+    async def batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(items) < self.max_boards:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            crops = np.concatenate([crops for crops, _ in items], axis=0)
+            t0 = time.perf_counter()
+            try:
+                probs = await loop.run_in_executor(self.predict_pool, self.predict, crops)
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            m = self.metrics
+            m.predict_ms_total += (time.perf_counter() - t0) * 1000.0
+            m.batches += 1
+            m.boards += len(items)
+            m.max_batch = max(m.max_batch, len(items))
+            m.batch_hist[len(items)] = m.batch_hist.get(len(items), 0) + 1
+            for i, (_, fut) in enumerate(items):
+                if not fut.done():
+                    fut.set_result((probs[i*64:(i+1)*64], len(items)))
+
+    async def handle_predict(self, body):
+        t0 = time.perf_counter()
+        req = json.loads(body)
+        image_bytes = base64.b64decode(req["image"])
+        loop = asyncio.get_running_loop()
+        crops = await loop.run_in_executor(self.prep_pool, self.preprocess, image_bytes,
+                                           req["corners"], bool(req.get("flip180", False)))
+        fut = loop.create_future()
+        await self.queue.put((crops, fut))
+        probs, batch_size = await fut
+        placement, full_fen = fen_from_probs(probs, self.class_names)
+        latency_ms = (time.perf_counter() - t0) * 1000.0
+        self.metrics.requests += 1
+        self.metrics.latency_ms_total += latency_ms
+        return {"placement": placement, "fen": full_fen,
+                "batch_size": batch_size, "latency_ms": round(latency_ms, 2)}
+
+    async def handle_conn(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    k, v = line.decode("latin-1").split(":", 1)
+                    headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = 200, None
+                try:
+                    if method == "POST" and path == "/predict":
+                        payload = await self.handle_predict(body)
+                    elif method == "GET" and path == "/metrics":
+                        payload = self.metrics.as_dict(self.queue.qsize())
+                    elif method == "GET" and path == "/health":
+                        payload = {"ok": True}
+                    else:
+                        status, payload = 404, {"error": f"no route {method} {path}"}
+                except (KeyError, ValueError) as e:
+                    self.metrics.errors += 1
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    self.metrics.errors += 1
+                    status, payload = 500, {"error": str(e)}
+
+                data = json.dumps(payload).encode()
+                reason = {200: "OK", 400: "Bad Request", 404: "Not Found"}.get(status, "Internal Server Error")
+                writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, unix=None):
+        self.queue = asyncio.Queue()
+        # warm up every batch shape so the first real requests don't pay for graph tracing
+        boards = 1
+        while True:
+            self.predict(np.zeros((boards * 64, self.img_size, self.img_size, 3), dtype=np.uint8))
+            if boards >= self.max_boards:
+                break
+            boards = min(2 * boards, self.max_boards)
+        batcher = asyncio.create_task(self.batcher())
+        if unix:
+            server = await asyncio.start_unix_server(self.handle_conn, path=unix)
+            print(f"✅ Serving on unix:{unix}")
+        else:
+            server = await asyncio.start_server(self.handle_conn, host, port)
+            print(f"✅ Serving on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", required=True, type=str)
+    ap.add_argument("--img-size", type=int, default=96)
+    ap.add_argument("--host", type=str, default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--unix", type=str, help="Serve on this Unix socket path instead of TCP")
+    ap.add_argument("--window-ms", type=float, default=5.0, help="Max wait to fill a predict batch")
+    ap.add_argument("--max-boards", type=int, default=32, help="Max boards (x64 crops) per predict batch")
+    ap.add_argument("--workers", type=int, default=4, help="Decode/warp threads")
+    args = ap.parse_args()
+
+    server = InferenceServer(args.model, img_size=args.img_size, window_ms=args.window_ms,
+                             max_boards=args.max_boards, workers=args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        print("Stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+infer_video.py
+Streaming FEN recognition from a video file or camera with a fixed board (one corners JSON).
+Pipeline stages run in separate threads joined by bounded queues so decode, warp and
+inference overlap on different cores:
+    decode (cv2.VideoCapture) -> preprocess (warp_squares + flip) -> classify (main thread)
+The 180° flip is decided on the first frame and applied to every later one.
+When a downstream stage falls behind, the oldest queued frame is dropped so the pipeline
+always works on the freshest frame (--no-drop blocks instead, for offline video files).
+Per-square probabilities are smoothed over time (exponential moving average) and a FEN is
+emitted only when the smoothed position changes. Per-stage throughput is reported at the end.
+"""
+
+import argparse, json, queue, threading, time, numpy as np, cv2
+from .infer_image import load_classifier, load_corners, fen_from_probs
+from .warp import warp_squares
+from .squares import a1_is_dark, squares_batch
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.dropped = 0
+
+    def report(self, elapsed):
+        per_item = 1000.0 * self.busy / self.items if self.items else 0.0
+        return (f"{self.name:<10} {self.items:>6} items  {self.items / max(elapsed, 1e-9):7.1f}/s  "
+                f"{per_item:7.1f} ms/item busy  {self.dropped:>5} dropped")
+
+# Put without blocking; if the queue is full, drop its oldest item to make room
+def put_latest(q, item, stats):
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+                stats.dropped += 1
+            except queue.Empty:
+                pass
+
+def decode_stage(cap, out_q, stats, stop, drop, max_frames=None):
+    idx = 0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        ok, frame = cap.read()
+        if not ok:
+            break
+        stats.busy += time.perf_counter() - t0
+        stats.items += 1
+        item = (idx, time.perf_counter(), frame)
+        if drop:
+            put_latest(out_q, item, stats)
+        else:
+            out_q.put(item)
+        idx += 1
+        if max_frames and idx >= max_frames:
+            break
+    out_q.put(None)
+
+# The 180° flip is decided on the first frame (or forced by --flip180) and kept: re-checking a1
+# per frame could flip mid-stream (a hand over the board) and the EMA would mix rotated boards
+def preprocess_stage(in_q, out_q, stats, corners, img_size, flip180, drop):
+    flip = flip180 or None
+    while True:
+        item = in_q.get()
+        if item is None:
+            break
+        idx, t_cap, frame = item
+        t0 = time.perf_counter()
+        crops = warp_squares(frame, corners, img_size=img_size, pad=2)
+        grid = crops.reshape(8, 8, *crops.shape[1:])
+        if flip is None:
+            flip = not a1_is_dark(grid)
+        crops = squares_batch(grid[::-1, ::-1, ::-1, ::-1] if flip else grid)
+        stats.busy += time.perf_counter() - t0
+        stats.items += 1
+        if drop:
+            put_latest(out_q, (idx, t_cap, crops), stats)
+        else:
+            out_q.put((idx, t_cap, crops))
+    out_q.put(None)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--video", type=str, help="Video file path")
+    ap.add_argument("--camera", type=int, help="Camera device index")
+    ap.add_argument("--corners", required=True, type=str, help="Corner JSON for the (fixed) board")
+    ap.add_argument("--model", required=True, type=str)
+    ap.add_argument("--img-size", type=int, default=96)
+    ap.add_argument("--flip180", action="store_true", help="force 180° flip if needed")
+    ap.add_argument("--smoothing", type=float, default=0.6,
+                    help="EMA weight of past frames for per-square probabilities (0 = no smoothing)")
+    ap.add_argument("--queue-size", type=int, default=2, help="Bounded queue length between stages")
+    ap.add_argument("--no-drop", action="store_true", help="Block instead of dropping stale frames")
+    ap.add_argument("--max-frames", type=int, help="Stop after this many decoded frames")
+    ap.add_argument("--out", type=str, help="Optional .jsonl log of emitted FENs")
+    args = ap.parse_args()
+
+    if args.video is None and args.camera is None:
+        raise SystemExit("Provide either --video or --camera")
+    cap = cv2.VideoCapture(args.video if args.video is not None else args.camera)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open {args.video if args.video is not None else f'camera {args.camera}'}")
+    corners = load_corners(args.corners)
+    model, class_names = load_classifier(args.model)
+    # warm up before frames start flowing
+    model.predict(np.zeros((64, args.img_size, args.img_size, 3), dtype=np.float32))
+
+    drop = not args.no_drop
+    frames_q = queue.Queue(maxsize=args.queue_size)
+    batches_q = queue.Queue(maxsize=args.queue_size)
+    stop = threading.Event()
+    decode_stats, prep_stats, infer_stats = StageStats("decode"), StageStats("preprocess"), StageStats("classify")
+    threads = [
+        threading.Thread(target=decode_stage, daemon=True,
+                         args=(cap, frames_q, decode_stats, stop, drop, args.max_frames)),
+        threading.Thread(target=preprocess_stage, daemon=True,
+                         args=(frames_q, batches_q, prep_stats, corners, args.img_size, args.flip180, drop)),
+    ]
+    out_f = open(args.out, "w") if args.out else None
+
+    smoothed = None
+    last_placement = None
+    emitted = 0
+    lat_total = 0.0
+    t_start = time.perf_counter()
+    for t in threads:
+        t.start()
+    try:
+        while True:
+            item = batches_q.get()
+            if item is None:
+                break
+            idx, t_cap, crops = item
+            t0 = time.perf_counter()
+            probs = model.predict(crops.astype(np.float32) / 255.0)
+            # temporal smoothing of the 64 per-square distributions
+            if smoothed is None or args.smoothing <= 0:
+                smoothed = probs
+            else:
+                smoothed = args.smoothing * smoothed + (1.0 - args.smoothing) * probs
+            placement, full_fen = fen_from_probs(smoothed, class_names)
+            infer_stats.busy += time.perf_counter() - t0
+            infer_stats.items += 1
+            lat_total += time.perf_counter() - t_cap
+
+            if placement != last_placement:
+                last_placement = placement
+                emitted += 1
+                print(f"[frame {idx}] {full_fen}")
+                if out_f:
+                    out_f.write(json.dumps({"frame": idx, "placement": placement, "fen": full_fen}) + "\n")
+    except KeyboardInterrupt:
+        stop.set()
+    finally:
+        stop.set()
+        cap.release()
+        if out_f:
+            out_f.close()
+
+    elapsed = time.perf_counter() - t_start
+    print(f"\n✅ {infer_stats.items} frames classified in {elapsed:.2f}s, {emitted} position changes")
+    for s in (decode_stats, prep_stats, infer_stats):
+        print(s.report(elapsed))
+    if infer_stats.items:
+        print(f"avg capture→FEN latency: {1000.0 * lat_total / infer_stats.items:.1f} ms")
+
+if __name__ == "__main__":
+    main()
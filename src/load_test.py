@@ -0,0 +1,55 @@
+"""
+load_test.py
+Load test for infer_server.py: fires --requests predictions from --concurrency client
+threads (each with its own keep-alive connection), then reports throughput, latency
+percentiles and the server's /metrics (batch sizes reached by micro-batching).
+"""
+
+import argparse, time, numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from .infer_client import connect, request, predict_payload
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--image", required=True, type=str)
+    ap.add_argument("--corners", required=True, type=str)
+    ap.add_argument("--host", type=str, default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--unix", type=str, help="Unix socket path of the server")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=16)
+    args = ap.parse_args()
+
+    # encode once, every request sends the same photo
+    payload = predict_payload(args.image, args.corners)
+    per_worker = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+                  for i in range(args.concurrency)]
+
+    def worker(n):
+        conn = connect(args.host, args.port, args.unix)
+        lat = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            request(conn, "POST", "/predict", payload)
+            lat.append(time.perf_counter() - t0)
+        conn.close()
+        return lat
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = [l for lat in pool.map(worker, per_worker) for l in lat]
+    elapsed = time.perf_counter() - t_start
+
+    lat_ms = np.array(latencies) * 1000.0
+    print(f"{len(latencies)} requests, concurrency {args.concurrency}, {elapsed:.2f}s")
+    print(f"throughput: {len(latencies) / elapsed:.1f} boards/s")
+    print("latency ms: p50 {:.1f}  p90 {:.1f}  p99 {:.1f}  max {:.1f}".format(
+        *np.percentile(lat_ms, [50, 90, 99]), lat_ms.max()))
+
+    metrics = request(connect(args.host, args.port, args.unix), "GET", "/metrics")
+    print("server metrics:")
+    for k, v in metrics.items():
+        print(f"  {k}: {v}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+packed.py
+Packed dataset format: square crops stored as sharded uint8 .npy arrays instead of one PNG each.
+Layout of a packed root (data/dataset/packed/ by default):
+    shard_00000.npy    uint8 (n, img_size, img_size, 3) crops
+    labels_00000.npy   int16 (n,) class indices into index.json "classes"
+    index.json         {"img_size", "classes", "channel_order", "shards": [{"images", "labels", "count"}], "sources"}
+Class order is sorted(LABELS), the same order image_dataset_from_directory infers from the
+raw/<label>/ folders, so a model trained on either format gets the same .classes.json.
+Crops are stored as OpenCV produces them (BGR, recorded as index.json "channel_order"), which is
+also what inference feeds the model; train_classifier converts the PNG sources (decoded as RGB)
+to BGR so every dataset format trains on the same channel order.
+Shards are opened with np.load(mmap_mode="r"), so training reads crops without decoding files.
+"""
+
+import json, numpy as np
+from pathlib import Path
+from .fen_utils import LABELS
+
+CLASSES = sorted(LABELS)
+
+class ShardWriter:
+    # Appends (crops, labels) per source image, flushing a shard every `shard_size` crops
+    # With append=True an existing index is extended and already packed sources are skipped
+    def __init__(self, root, img_size, shard_size=2048, append=True):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.img_size = img_size
+        self.shard_size = shard_size
+        self.index = {"img_size": img_size, "classes": CLASSES, "channel_order": "bgr", "shards": [], "sources": []}
+        index_path = self.root / "index.json"
+        if append and index_path.exists():
+            self.index = json.load(open(index_path))
+            if self.index["img_size"] != img_size:
+                raise ValueError(f"{self.root} holds {self.index['img_size']}px crops, not {img_size}px")
+        else:
+            for old in list(self.root.glob("shard_*.npy")) + list(self.root.glob("labels_*.npy")):
+                old.unlink()
+        self.sources = set(self.index["sources"])
+        self.crops, self.labels, self.pending = [], [], 0
+
+    def has(self, source):
+        return source in self.sources
+
+    def add(self, crops, labels, source):
+        self.crops.append(np.asarray(crops, dtype=np.uint8))
+        self.labels.append(np.array([CLASSES.index(l) for l in labels], dtype=np.int16))
+        self.index["sources"].append(source)
+        self.sources.add(source)
+        self.pending += len(crops)
+        if self.pending >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        k = len(self.index["shards"])
+        images_name, labels_name = f"shard_{k:05d}.npy", f"labels_{k:05d}.npy"
+        np.save(self.root / images_name, np.concatenate(self.crops, axis=0))
+        np.save(self.root / labels_name, np.concatenate(self.labels, axis=0))
+        self.index["shards"].append({"images": images_name, "labels": labels_name, "count": self.pending})
+        self.crops, self.labels, self.pending = [], [], 0
+
+    def close(self):
+        self.flush()
+        with open(self.root / "index.json", "w") as f:
+            json.dump(self.index, f, indent=2)
+        return sum(s["count"] for s in self.index["shards"])
+
+# Open a packed root -> (list of memmapped image shards, shard start offsets, all labels, index)
+def open_packed(root):
+    root = Path(root)
+    index = json.load(open(root / "index.json"))
+    images = [np.load(root / s["images"], mmap_mode="r") for s in index["shards"]]
+    labels = np.concatenate([np.load(root / s["labels"]) for s in index["shards"]]).astype(np.int64)
+    starts = np.cumsum([0] + [len(m) for m in images])[:-1]
+    return images, starts, labels, index
+
+# Gather crops for global indices from the memmapped shards (sorted for sequential reads)
+def gather(images, starts, idx):
+    idx = np.sort(idx)
+    out = np.empty((len(idx), *images[0].shape[1:]), dtype=np.uint8)
+    shard_ids = np.searchsorted(starts, idx, side="right") - 1
+    for s in np.unique(shard_ids):
+        m = shard_ids == s
+        out[m] = images[s][idx[m] - starts[s]]
+    return idx, out
@@ -0,0 +1,124 @@
+"""
+profiling.py
+Shared runtime instrumentation for the CLIs (infer_image, build_dataset, train_classifier,
+annotate_corners). Code marks pipeline stages and counts work done:
+    with stage("warp"):
+        ...
+    count("squares", 64)
+Disabled by default: stage() then hands back one shared no-op context manager and count()
+returns immediately, so instrumented code costs a function call per stage.
+With --profile <trace.json> a CLI records every stage as a Chrome-trace / Perfetto event
+(open in chrome://tracing or ui.perfetto.dev), prints a per-stage summary table, and with
+--profile-hot <stage> also runs cProfile inside that stage and writes <trace>.prof.
+"""
+
+import cProfile, json, os, pstats, threading, time
+from contextlib import nullcontext
+from pathlib import Path
+
+_NULL = nullcontext()
+
+class _Stage:
+    __slots__ = ("prof", "name", "t0")
+
+    def __init__(self, prof, name):
+        self.prof = prof
+        self.name = name
+
+    def __enter__(self):
+        if self.name == self.prof.hot_stage:
+            self.prof.cprofile.enable()
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter_ns()
+        if self.name == self.prof.hot_stage:
+            self.prof.cprofile.disable()
+        # list.append is atomic, so stages may be recorded from several threads
+        self.prof.events.append((self.name, self.t0, t1 - self.t0, threading.get_ident()))
+        return False
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.events = []  # (stage, start ns, duration ns, thread id)
+        self.counters = {}
+        self.hot_stage = None
+        self.cprofile = None
+        self.t_start = time.perf_counter_ns()
+
+    def enable(self, hot_stage=None):
+        self.enabled = True
+        self.t_start = time.perf_counter_ns()
+        if hot_stage:
+            self.hot_stage = hot_stage
+            self.cprofile = cProfile.Profile()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL
+        return _Stage(self, name)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        wall_ms = (time.perf_counter_ns() - self.t_start) / 1e6
+        per_stage = {}
+        for name, _, dur, _ in self.events:
+            per_stage.setdefault(name, []).append(dur / 1e6)
+        lines = [f"{'stage':<22} {'calls':>7} {'total ms':>11} {'mean ms':>9} {'max ms':>9} {'% wall':>7}"]
+        for name, durs in sorted(per_stage.items(), key=lambda kv: -sum(kv[1])):
+            total = sum(durs)
+            lines.append(f"{name:<22} {len(durs):>7} {total:11.1f} {total / len(durs):9.2f} "
+                         f"{max(durs):9.2f} {100 * total / max(wall_ms, 1e-9):6.1f}%")
+        lines.append(f"wall: {wall_ms:.1f} ms")
+        for name, n in self.counters.items():
+            lines.append(f"{name}: {n} ({1000.0 * n / max(wall_ms, 1e-9):.1f}/s)")
+        return "\n".join(lines)
+
+    # Chrome trace event format: complete ("X") events in microseconds + final counter values
+    def dump_trace(self, path):
+        pid = os.getpid()
+        events = [{"name": name, "ph": "X", "pid": pid, "tid": tid,
+                   "ts": (t0 - self.t_start) / 1000.0, "dur": dur / 1000.0}
+                  for name, t0, dur, tid in self.events]
+        now_us = (time.perf_counter_ns() - self.t_start) / 1000.0
+        for name, n in self.counters.items():
+            events.append({"name": name, "ph": "C", "pid": pid, "ts": now_us, "args": {name: n}})
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def report(self, trace_path):
+        print("\n=== profile ===")
+        print(self.summary())
+        self.dump_trace(trace_path)
+        print(f"trace written to {trace_path} (chrome://tracing or ui.perfetto.dev)")
+        if self.cprofile:
+            prof_path = str(Path(trace_path).with_suffix(".prof"))
+            self.cprofile.dump_stats(prof_path)
+            print(f"cProfile of stage '{self.hot_stage}' written to {prof_path}, top functions:")
+            pstats.Stats(self.cprofile).sort_stats("cumulative").print_stats(15)
+
+# process-wide profiler used by all the CLIs
+PROFILER = Profiler()
+stage = PROFILER.stage
+count = PROFILER.count
+
+def add_profile_args(ap):
+    ap.add_argument("--profile", type=str, metavar="TRACE_JSON",
+                    help="Time pipeline stages, print a summary and write a Chrome/Perfetto trace")
+    ap.add_argument("--profile-hot", type=str, metavar="STAGE",
+                    help="With --profile, also run cProfile inside this stage (writes <trace>.prof)")
+
+def start_profiling(args):
+    if args.profile:
+        PROFILER.enable(hot_stage=args.profile_hot)
+
+def finish_profiling(args):
+    if args.profile:
+        PROFILER.report(args.profile)
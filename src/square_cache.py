@@ -0,0 +1,100 @@
+"""
+square_cache.py
+Content-addressed cache of per-square class probabilities, used in front of model.predict.
+Each normalized square crop is fingerprinted by a small grayscale thumbnail quantized to
+`tolerance` gray levels, so a square that has not changed beyond that tolerance between
+photos maps to the same key and reuses its cached probabilities instead of being classified.
+The cache persists to an .npz file with LRU eviction, and is discarded when the model file
+changes (its content hash is stored alongside the entries).
+"""
+
+import hashlib, os, numpy as np, cv2
+from collections import OrderedDict
+from pathlib import Path
+
+KEY_BYTES = 16
+
+# Content hash of the model file, so cached probabilities never outlive the model
+def model_signature(model_path):
+    h = hashlib.sha1()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# (N, h, w, C) uint8 crops -> N fingerprint keys (bytes)
+def fingerprints(crops, thumb=12, tolerance=8):
+    keys = []
+    for crop in crops:
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 and crop.shape[2] == 3 else crop
+        small = cv2.resize(gray, (thumb, thumb), interpolation=cv2.INTER_AREA)
+        q = (small // tolerance).astype(np.uint8)
+        keys.append(hashlib.blake2b(q.tobytes(), digest_size=KEY_BYTES).digest())
+    return keys
+
+class SquareCache:
+    def __init__(self, path, model_path, tolerance=8, thumb=12, max_entries=200_000):
+        self.path = Path(path)
+        self.tolerance = tolerance
+        self.thumb = thumb
+        self.max_entries = max_entries
+        # the fingerprint settings are part of the signature: changing them invalidates keys
+        self.signature = f"{model_signature(model_path)}:{thumb}:{tolerance}"
+        self.entries = OrderedDict()  # key -> probs, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            data = np.load(self.path, allow_pickle=False)
+            if str(data["signature"]) != self.signature:
+                print(f"⚠️ Model changed, discarding square cache {self.path}")
+                return
+            for key, probs in zip(data["keys"], data["probs"]):
+                self.entries[key.tobytes()] = probs
+        except (OSError, KeyError, ValueError) as e:
+            print(f"⚠️ Could not load square cache {self.path}: {e}")
+            self.entries.clear()
+
+    def save(self):
+        if not self.entries:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        keys = np.frombuffer(b"".join(self.entries.keys()), dtype=np.uint8).reshape(-1, KEY_BYTES)
+        probs = np.stack(list(self.entries.values()))
+        tmp = self.path.with_name(self.path.name + ".tmp.npz")
+        np.savez(tmp, keys=keys, probs=probs, signature=np.array(self.signature))
+        os.replace(tmp, self.path)
+
+    # Class probabilities for uint8 crops; only cache misses go through predict_fn
+    def predict(self, crops, predict_fn):
+        keys = fingerprints(crops, self.thumb, self.tolerance)
+        miss_idx = {}  # key -> index of its first crop; duplicate squares are predicted once
+        for i, key in enumerate(keys):
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            elif key not in miss_idx:
+                miss_idx[key] = i
+        self.misses += len(miss_idx)
+        self.hits += len(keys) - len(miss_idx)
+
+        if miss_idx:
+            new_probs = predict_fn(crops[list(miss_idx.values())])
+            for key, probs in zip(miss_idx, new_probs):
+                self.entries[key] = probs
+        out = np.stack([self.entries[key] for key in keys])
+        # LRU eviction
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return out
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self):
+        return (f"square cache: {self.hits}/{self.hits + self.misses} hits "
+                f"({100.0 * self.hit_rate():.1f}%), {len(self.entries)} entries")
@@ -5,8 +5,16 @@ Assumes dataset is organized in subfolders per class, e.g.:
 dataset-root/
     empty/
     color_piece 
+or a packed shard folder (build_dataset.py --format npy) read through memmaps with --packed,
+or crops generated on the fly from photos + corners + fen_list.csv with --photos (corner jitter
+as perspective augmentation, no intermediate dataset on disk),
+or a deduplicated, class-balanced subset of either stored format listed in a --manifest (dedupe.py).
+Every source yields BGR crops (the PNG sources are converted after decoding), the channel order
+of the packed shards and of the crops inference feeds the model.
 Hyperparameters:
-- image size: 96x96
+- image size: 96x96 (--img-size: crop size of the dataset)
+- model variant (--variant, e.g. 48-gray-sep-w0.5): input size, grayscale input, depthwise-separable
+  conv blocks and a width multiplier; the default is the full 96x96 colour CNN
 - batch size: 64
 - epochs: 12
 - Dropout: 0.15 after conv layers, 0.25 before dense
@@ -14,65 +22,346 @@ Hyperparameters:
 - ReLU activations, batch normalization
 - Adam optimizer, categorical crossentropy loss
 - Softmax output for multi-class classification
+--sweep trains several variants on the same data, measures each one's CPU latency on a 64-crop
+batch (through backends.py) and parameter count, and writes a table of accuracy against latency
+with the Pareto-optimal variants marked.
 """
 
-import argparse, pathlib, json, tensorflow as tf
+import argparse, csv, pathlib, json, time, numpy as np, cv2, tensorflow as tf
+from .packed import CLASSES, open_packed, gather
+from .warp import warp_squares
+from .squares import maybe_flip_squares
+from .build_all import discover_jobs
+from .build_dataset import parse_fen_placement
+from .backends import load_backend, load_class_names
+from .profiling import stage, count, add_profile_args, start_profiling, finish_profiling
+from .dedupe import read_manifest
 
 # Define a small CNN model w/ tensorflow.keras
-def build_small_cnn(num_classes: int, input_size: int = 96):
+# channels: 3 (BGR) or 1 (grayscale); width: multiplier on every layer's filter count;
+# separable: depthwise-separable convolutions after the first block
+def build_small_cnn(num_classes: int, input_size: int = 96, channels: int = 3, width: float = 1.0,
+                    separable: bool = False):
     from tensorflow.keras import layers, models
-    inputs = layers.Input(shape=(input_size, input_size, 3))
+    scaled = lambda filters: max(8, int(round(filters * width)))
+    inputs = layers.Input(shape=(input_size, input_size, channels))
     x = inputs
     # 3 conv blocks with increasing filter features
     # each layer has Conv2D + BatchNorm + ReLU + MaxPool + Dropout of 15%
-    for filters in [32, 64, 96]:
-        x = layers.Conv2D(filters, 3, padding="same")(x)
+    # (the first block stays a full conv: a separable one on 1-3 input channels saves nothing)
+    for i, filters in enumerate([32, 64, 96]):
+        conv = layers.SeparableConv2D if separable and i > 0 else layers.Conv2D
+        x = conv(scaled(filters), 3, padding="same")(x)
         x = layers.BatchNormalization()(x)
         x = layers.ReLU()(x)
         x = layers.MaxPooling2D()(x)
         x = layers.Dropout(0.15)(x)
     # Final layers
-    x = tf.keras.layers.Conv2D(128, 3, padding="same")(x)
+    conv = tf.keras.layers.SeparableConv2D if separable else tf.keras.layers.Conv2D
+    x = conv(scaled(128), 3, padding="same")(x)
     x = tf.keras.layers.BatchNormalization()(x)
     x = tf.keras.layers.ReLU()(x)
     x = tf.keras.layers.GlobalAveragePooling2D()(x)
     x = tf.keras.layers.Dropout(0.25)(x)
-    x = tf.keras.layers.Dense(128, activation="relu")(x)
+    x = tf.keras.layers.Dense(scaled(128), activation="relu")(x)
     outputs = tf.keras.layers.Dense(num_classes, activation="softmax")(x)
     model = models.Model(inputs, outputs)
     model.compile(optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"])
     return model
 
+# Variants trained by a bare --sweep: input size, grayscale, separable blocks and width, alone and combined
+DEFAULT_SWEEP = ["96", "64", "48", "32", "48-gray", "48-sep", "48-w0.5", "48-gray-sep-w0.5", "32-gray-sep-w0.5"]
+
+# Model variant spec "<size>[-gray][-sep][-w<multiplier>]", e.g. "96" (the default CNN) or "48-gray-sep-w0.5"
+def parse_variant(spec):
+    parts = str(spec).lower().split("-")
+    try:
+        variant = {"input_size": int(parts[0]), "channels": 3, "width": 1.0, "separable": False}
+        for part in parts[1:]:
+            if part == "gray":
+                variant["channels"] = 1
+            elif part == "sep":
+                variant["separable"] = True
+            elif part.startswith("w"):
+                variant["width"] = float(part[1:])
+            else:
+                raise ValueError(part)
+    except ValueError:
+        raise SystemExit(f"Bad variant {spec!r}, expected e.g. 96, 48-gray or 32-gray-sep-w0.5")
+    return variant
+
+def variant_name(variant):
+    name = str(variant["input_size"])
+    name += "-gray" if variant["channels"] == 1 else ""
+    name += "-sep" if variant["separable"] else ""
+    name += f"-w{variant['width']:g}" if variant["width"] != 1.0 else ""
+    return name
+
+# Normalized dataset crops -> a variant's input: resized to its size, channels averaged for gray
+# (backends.fit_input does the same to inference crops)
+def variant_input(x, variant):
+    size = variant["input_size"]
+    if x.shape[1] != size or x.shape[2] != size:
+        x = tf.image.resize(x, (size, size), method="area")
+    if variant["channels"] == 1:
+        x = tf.reduce_mean(x, axis=-1, keepdims=True)
+    return x
+
+# PNGs decode as RGB; every source yields BGR crops, the order inference (cv2) feeds the model
+def rgb_to_bgr(x, y):
+    return x[..., ::-1], y
+
+# Folder-of-PNGs source: raw/<label>/*.png via image_dataset_from_directory
+# 80% train, 20% val split
+def directory_datasets(dataset_root, img_size, batch_size):
+    image_size = (img_size, img_size)
+    train_raw = tf.keras.utils.image_dataset_from_directory(
+        dataset_root, validation_split=0.2, subset="training",
+        seed=1337, image_size=image_size, batch_size=batch_size,
+        labels="inferred", label_mode="categorical", shuffle=True
+    )
+    val_raw = tf.keras.utils.image_dataset_from_directory(
+        dataset_root, validation_split=0.2, subset="validation",
+        seed=1337, image_size=image_size, batch_size=batch_size,
+        labels="inferred", label_mode="categorical", shuffle=True
+    )
+    return train_raw.map(rgb_to_bgr), val_raw.map(rgb_to_bgr), list(train_raw.class_names)
+
+# Packed source: memmapped .npy shards written by build_dataset --format npy
+# same deterministic 80/20 split (seeded permutation), batches gathered straight from the memmaps
+# `subset`: only these global crop indices (a packed --manifest)
+def packed_datasets(packed_root, img_size, batch_size, seed=1337, subset=None):
+    images, starts, labels, index = open_packed(packed_root)
+    if index["img_size"] != img_size:
+        raise SystemExit(f"{packed_root} holds {index['img_size']}px crops, pass --img-size {index['img_size']}")
+    # shards written before channel_order was recorded are BGR as well
+    if index.get("channel_order", "bgr") != "bgr":
+        raise SystemExit(f"{packed_root} holds {index['channel_order']} crops, expected bgr")
+    class_names = index["classes"]
+    num_classes = len(class_names)
+    pool = np.arange(len(labels)) if subset is None else np.asarray(subset)
+    perm = np.random.default_rng(seed).permutation(pool)
+    n_val = int(0.2 * len(perm))
+    train_idx, val_idx = perm[n_val:], perm[:n_val]
+    print(f"Packed dataset: {len(perm)} crops, {len(train_idx)} for training, {len(val_idx)} for validation.")
+
+    def load_batch(idx):
+        with stage("gather_batch"):
+            idx, x = gather(images, starts, idx)
+        return x, labels[idx]
+
+    def make(idx, shuffle):
+        ds = tf.data.Dataset.from_tensor_slices(idx)
+        if shuffle:
+            ds = ds.shuffle(len(idx), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size)
+
+        def fetch(i):
+            x, y = tf.numpy_function(load_batch, [i], [tf.uint8, tf.int64])
+            x.set_shape([None, img_size, img_size, 3])
+            y.set_shape([None])
+            return x, tf.one_hot(y, num_classes)
+        return ds.map(fetch, num_parallel_calls=tf.data.AUTOTUNE)
+
+    return make(train_idx, True), make(val_idx, False), class_names
+
+# PNG manifest source: path,label rows written by dedupe.py, same seeded 80/20 split as packed
+def manifest_datasets(paths, names, img_size, batch_size, seed=1337):
+    class_names = CLASSES
+    label_ids = np.array([class_names.index(n) for n in names])
+    perm = np.random.default_rng(seed).permutation(len(paths))
+    n_val = int(0.2 * len(perm))
+    print(f"Manifest: {len(perm)} crops, {len(perm) - n_val} for training, {n_val} for validation.")
+
+    def load(path, label):
+        # decoded as RGB and resized like image_dataset_from_directory does, then BGR
+        x = tf.image.decode_png(tf.io.read_file(path), channels=3)
+        x = tf.image.resize(x, (img_size, img_size))
+        return rgb_to_bgr(x, tf.one_hot(label, len(class_names)))
+
+    def make(idx, shuffle):
+        ds = tf.data.Dataset.from_tensor_slices((np.array(paths)[idx], label_ids[idx]))
+        if shuffle:
+            ds = ds.shuffle(len(idx), seed=seed, reshuffle_each_iteration=True)
+        return ds.map(load, num_parallel_calls=tf.data.AUTOTUNE).batch(batch_size)
+
+    return make(perm[n_val:], True), make(perm[:n_val], False), class_names
+
+# Slightly move each corner (uniformly, up to `jitter` x board side) for perspective augmentation
+def jitter_corners(corners, jitter, rng):
+    side = np.linalg.norm(corners - np.roll(corners, 1, axis=0), axis=1).mean()
+    return corners + rng.uniform(-jitter, jitter, size=corners.shape).astype(np.float32) * side
+
+# Photo source: crops generated on the fly from input_imgs/<n>/ photos, corner JSONs and fen_list.csv
+# each photo is decoded once per epoch and yields all 64 labelled crops; training photos get
+# their corners jittered before sampling. The 80/20 split is by photo (seeded), so crops of
+# one photo never land in both train and validation.
+def photo_datasets(positions, corners_root, img_size, batch_size, jitter=0.02, seed=1337):
+    jobs = discover_jobs(positions, corners_root)
+    if not jobs:
+        raise SystemExit("No photos with FEN and corners found.")
+    class_names = CLASSES
+    num_classes = len(class_names)
+    paths = [str(p) for p, _, _ in jobs]
+    corners = [np.array(json.load(open(c)), dtype=np.float32) for _, c, _ in jobs]
+    labels = [np.array([class_names.index(l) for l in parse_fen_placement(f)], dtype=np.int64) for _, _, f in jobs]
+    perm = np.random.default_rng(seed).permutation(len(jobs))
+    n_val = max(1, int(0.2 * len(jobs))) if len(jobs) > 1 else 0
+    train_idx, val_idx = perm[n_val:], perm[:n_val]
+    print(f"Photo dataset: {len(jobs)} photos, {len(train_idx)} for training, {len(val_idx)} for validation.")
+
+    def load_photo(i, augment):
+        with stage("load_photo"):
+            return _load_photo(i, augment)
+
+    def _load_photo(i, augment):
+        img = cv2.imread(paths[i])
+        if img is None:
+            raise ValueError(f"Could not read image {paths[i]}")
+        c = corners[i]
+        if augment:
+            c = jitter_corners(c, jitter, np.random.default_rng())
+        crops = maybe_flip_squares(warp_squares(img, c, img_size=img_size, pad=2, cache=not augment))
+        return crops, labels[i]
+
+    def make(idx, augment):
+        ds = tf.data.Dataset.from_tensor_slices(idx)
+        if augment:
+            ds = ds.shuffle(len(idx), seed=seed, reshuffle_each_iteration=True)
+
+        def fetch(i):
+            x, y = tf.numpy_function(lambda j: load_photo(int(j), augment), [i], [tf.uint8, tf.int64])
+            x.set_shape([64, img_size, img_size, 3])
+            y.set_shape([64])
+            return x, tf.one_hot(y, num_classes)
+        ds = ds.map(fetch, num_parallel_calls=tf.data.AUTOTUNE).unbatch()
+        if augment:
+            # mix crops from several photos in each batch
+            ds = ds.shuffle(64 * 16, seed=seed, reshuffle_each_iteration=True)
+        return ds.batch(batch_size)
+
+    return make(train_idx, True), make(val_idx, False), class_names
+
+# Export a trained Keras model to TFLite; with `calib_ds` (batches of normalized crops) the
+# weights and activations are int8 post-training quantized, keeping float32 input/output
+def export_tflite(model, out_path, calib_ds=None, calib_batches=50):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if calib_ds is not None:
+        def representative():
+            for x, _ in calib_ds.take(calib_batches):
+                for i in range(x.shape[0]):
+                    yield [x[i:i+1]]
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    pathlib.Path(out_path).write_bytes(converter.convert())
+
+# Export a trained Keras model to ONNX (needs the optional tf2onnx package)
+def export_onnx(model, out_path):
+    try:
+        import tf2onnx
+    except ImportError:
+        raise SystemExit("ONNX export needs tf2onnx: pip install tf2onnx")
+    spec = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="input"),)
+    fn = tf.function(lambda x: model(x, training=False))
+    tf2onnx.convert.from_function(fn, input_signature=spec, opset=13, output_path=str(out_path))
+
+# Write the requested export formats next to out_path, each with its own .classes.json
+def export_models(model, out_path, formats, class_names, calib_ds=None):
+    out_path = pathlib.Path(out_path)
+    for fmt in formats:
+        if fmt == "tflite":
+            path = out_path.with_suffix(".tflite")
+            export_tflite(model, path)
+        elif fmt == "int8":
+            path = out_path.with_name(out_path.stem + "_int8.tflite")
+            if calib_ds is None:
+                raise SystemExit("int8 export needs a dataset to calibrate on")
+            export_tflite(model, path, calib_ds=calib_ds)
+        elif fmt == "onnx":
+            path = out_path.with_suffix(".onnx")
+            export_onnx(model, path)
+        else:
+            raise SystemExit(f"Unknown export format {fmt}")
+        with open(str(path.with_suffix(".classes.json")), "w") as f:
+            json.dump(class_names, f, indent=2)
+        print(f"Exported {fmt} model to {path}")
+
+# Pick the dataset source from the CLI arguments
+def make_datasets(args):
+    if args.manifest:
+        keys, names, packed = read_manifest(args.manifest)
+        if packed:
+            if not args.packed:
+                raise SystemExit("This manifest indexes a packed dataset, pass its folder with --packed")
+            return packed_datasets(args.packed, args.img_size, args.batch_size, subset=keys)
+        return manifest_datasets(keys, names, args.img_size, args.batch_size)
+    if args.photos:
+        return photo_datasets(args.photos, args.corners_root, args.img_size,
+                              args.batch_size, jitter=args.corner_jitter)
+    if args.packed:
+        return packed_datasets(args.packed, args.img_size, args.batch_size)
+    if args.dataset_root:
+        return directory_datasets(args.dataset_root, args.img_size, args.batch_size)
+    raise SystemExit("Provide --dataset-root, --packed, --photos or --manifest")
+
+# Records each epoch as a profiling stage and counts epochs / train batches
+class StageCallback(tf.keras.callbacks.Callback):
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_stage = stage("epoch")
+        self.epoch_stage.__enter__()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_stage.__exit__(None, None, None)
+        count("epochs")
+
+    def on_train_batch_end(self, batch, logs=None):
+        count("batches")
+
 def main():
     # arguments: dataset path, output model path, image size, batch size, epochs
     ap = argparse.ArgumentParser()
-    ap.add_argument("--dataset-root", required=True, type=str,
+    ap.add_argument("--dataset-root", type=str,
                     help="folder with 13 class subfolders (created by build_dataset.py)")
+    ap.add_argument("--packed", type=str,
+                    help="packed shard folder (created by build_dataset.py --format npy), instead of --dataset-root")
+    ap.add_argument("--photos", type=str,
+                    help="generate crops on the fly from <photos>/<n>/ images + fen_list.csv (with --corners-root)")
+    ap.add_argument("--manifest", type=str,
+                    help="train on the crops listed in a dedupe.py manifest (with --packed for packed crops)")
+    ap.add_argument("--corners-root", type=str, default="data/corners",
+                    help="folder of <n>/ corner JSON folders for --photos")
+    ap.add_argument("--corner-jitter", type=float, default=0.02,
+                    help="max corner shift (fraction of board side) for --photos augmentation")
     ap.add_argument("--out", required=True, type=str,
                     help="path to save Keras model, e.g., models/classifier.keras")
     ap.add_argument("--img-size", type=int, default=96)
     ap.add_argument("--batch-size", type=int, default=64)
     ap.add_argument("--epochs", type=int, default=12)
+    ap.add_argument("--export", nargs="*", default=[], choices=["tflite", "int8", "onnx"],
+                    help="also export the model: tflite, int8 (quantized tflite calibrated on the crops), onnx")
+    ap.add_argument("--export-only", action="store_true",
+                    help="skip training: load the existing model at --out and only run --export")
+    ap.add_argument("--variant", type=str,
+                    help="model variant <size>[-gray][-sep][-w<mult>], e.g. 48-gray-sep-w0.5 (default: --img-size, colour)")
+    ap.add_argument("--sweep", nargs="*", metavar="VARIANT",
+                    help=f"train and time several variants instead (default list: {' '.join(DEFAULT_SWEEP)})")
+    ap.add_argument("--sweep-backend", default="tflite", choices=["keras", "tflite", "onnx"],
+                    help="runtime the --sweep latency is measured with")
+    ap.add_argument("--latency-threads", type=int, help="intra-op threads for the --sweep latency measurement")
+    ap.add_argument("--min-accuracy", type=float,
+                    help="with --sweep, report the fastest variant reaching this val accuracy (0-1)")
+    add_profile_args(ap)
     args = ap.parse_args()
 
-    image_size = (args.img_size, args.img_size)
-
-    # create raw datasets from directory
-    # 80% train, 20% val split
-    train_raw = tf.keras.utils.image_dataset_from_directory(
-        args.dataset_root, validation_split=0.2, subset="training",
-        seed=1337, image_size=image_size, batch_size=args.batch_size,
-        labels="inferred", label_mode="categorical", shuffle=True
-    )
-    val_raw = tf.keras.utils.image_dataset_from_directory(
-        args.dataset_root, validation_split=0.2, subset="validation",
-        seed=1337, image_size=image_size, batch_size=args.batch_size,
-        labels="inferred", label_mode="categorical", shuffle=True
-    )
-
-    class_names = list(train_raw.class_names)
-    num_classes = len(class_names)
+    start_profiling(args)
+    try:
+        run(args)
+    finally:
+        finish_profiling(args)
 
+# Augmented train / plain val datasets for one model variant, from the raw uint8 datasets
+def variant_datasets(train_raw, val_raw, variant):
     # Augmentation & normalization layers
     aug = tf.keras.Sequential([
         tf.keras.layers.RandomFlip("horizontal"),
@@ -80,7 +369,7 @@ def main():
         tf.keras.layers.RandomZoom(0.1),
         tf.keras.layers.RandomContrast(0.1),
     ])
-    def normalize(x): return tf.cast(x, tf.float32) / 255.0
+    def normalize(x): return variant_input(tf.cast(x, tf.float32) / 255.0, variant)
 
     # Prepare datasets
     # AUTOTUNE allows the dataset to fetch batches in the background while the model is training
@@ -93,14 +382,121 @@ def main():
     val_ds = (val_raw
               .map(lambda x, y: (normalize(x), y), num_parallel_calls=AUTOTUNE)
               .prefetch(AUTOTUNE))
+    return train_ds, val_ds
 
-    # Build & train model with the created datasets
-    model = build_small_cnn(num_classes=num_classes, input_size=args.img_size)
-    model.fit(train_ds, validation_data=val_ds, epochs=args.epochs)
+# Median CPU latency (ms) of one board through the inference backend for this file, timed the
+# way the inference tools run it: 64 uint8 BGR crops of crop_size (what they warp) normalized and
+# fitted to the model's input (backends.fit_input: resize, gray) before predict
+def measure_latency(model_path, crop_size, repeats=20, threads=None):
+    backend = load_backend(model_path, threads=threads)
+    crops = np.random.default_rng(0).integers(0, 256, (64, crop_size, crop_size, 3), dtype=np.uint8)
+    backend.predict(crops.astype(np.float32) / 255.0)  # warm-up / graph tracing
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        backend.predict(crops.astype(np.float32) / 255.0)
+        times.append(time.perf_counter() - t0)
+    return 1000.0 * float(np.median(times))
 
+# Variants no other variant beats on both latency and accuracy
+def pareto_front(rows):
+    return [r for r in rows
+            if not any(o["latency_ms"] <= r["latency_ms"] and o["val_acc"] >= r["val_acc"] and
+                       (o["latency_ms"] < r["latency_ms"] or o["val_acc"] > r["val_acc"]) for o in rows)]
+
+# Train every --sweep variant on the same data, save it as <out stem>_<variant>.keras (+ the
+# --sweep-backend export it is timed with) and write <out stem>_sweep.csv
+def sweep(args, train_raw, val_raw, class_names):
     out_path = pathlib.Path(args.out)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    model.save(str(out_path))
+    specs = args.sweep or DEFAULT_SWEEP
+    rows = []
+    for spec in specs:
+        variant = parse_variant(spec)
+        name = variant_name(variant)
+        if variant["input_size"] > args.img_size:
+            print(f"⚠️ {name}: input larger than the {args.img_size}px dataset crops, they will be upscaled")
+        print(f"\n=== {name} ===")
+        train_ds, val_ds = variant_datasets(train_raw, val_raw, variant)
+        model = build_small_cnn(num_classes=len(class_names), **variant)
+        t0 = time.perf_counter()
+        with stage(f"train_{name}"):
+            model.fit(train_ds, validation_data=val_ds, epochs=args.epochs, callbacks=[StageCallback()], verbose=2)
+        train_s = time.perf_counter() - t0
+        val_acc = float(model.evaluate(val_ds, verbose=0, return_dict=True)["accuracy"])
+
+        path = out_path.with_name(f"{out_path.stem}_{name}.keras")
+        model.save(str(path))
+        with open(str(path.with_suffix(".classes.json")), "w") as f:
+            json.dump(class_names, f, indent=2)
+        if args.sweep_backend != "keras":
+            export_models(model, path, [args.sweep_backend], class_names)
+            path = path.with_suffix("." + args.sweep_backend)
+        with stage(f"latency_{name}"):
+            latency = measure_latency(path, args.img_size, threads=args.latency_threads)
+        rows.append({"variant": name, "params": model.count_params(), "latency_ms": round(latency, 2),
+                     "val_acc": round(val_acc, 4), "train_s": round(train_s, 1), "model": str(path)})
+        print(f"{name}: {rows[-1]['params']} params, {latency:.2f} ms / 64 crops, val acc {100 * val_acc:.1f}%")
+
+    front = pareto_front(rows)
+    for r in rows:
+        r["pareto"] = int(r in front)
+    rows.sort(key=lambda r: r["latency_ms"])
+    table_path = out_path.with_name(f"{out_path.stem}_sweep.csv")
+    with open(table_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"\n{args.sweep_backend} latency per board ({args.img_size}px crops incl. resize to the variant), "
+          f"{args.epochs} epochs each (* = Pareto-optimal)")
+    print(f"{'variant':<20} {'params':>9} {'ms/64':>8} {'val acc':>8} {'train s':>8}")
+    for r in rows:
+        mark = "*" if r["pareto"] else " "
+        print(f"{mark}{r['variant']:<19} {r['params']:>9} {r['latency_ms']:8.2f} {100 * r['val_acc']:7.1f}% "
+              f"{r['train_s']:8.1f}")
+    if args.min_accuracy is not None:
+        ok = [r for r in rows if r["val_acc"] >= args.min_accuracy]
+        if ok:
+            print(f"✅ Fastest variant with val accuracy >= {args.min_accuracy:.0%}: {ok[0]['variant']} ({ok[0]['model']})")
+        else:
+            print(f"⚠️ No variant reached val accuracy {args.min_accuracy:.0%}")
+    print(f"Sweep table written to {table_path}")
+
+def run(args):
+    out_path = pathlib.Path(args.out)
+    # exporting an existing model only needs the dataset to calibrate int8
+    if args.export_only and "int8" not in args.export:
+        model = tf.keras.models.load_model(str(out_path))
+        export_models(model, out_path, args.export, load_class_names(out_path))
+        return
+
+    # create raw datasets (uint8/float images + one-hot labels)
+    with stage("dataset_setup"):
+        train_raw, val_raw, class_names = make_datasets(args)
+    num_classes = len(class_names)
+
+    if args.sweep is not None:
+        sweep(args, train_raw, val_raw, class_names)
+        return
+
+    if args.export_only:
+        model = tf.keras.models.load_model(str(out_path))
+        # calibrate on crops shaped like the saved model's input
+        size, _, channels = model.input_shape[1:]
+        _, val_ds = variant_datasets(train_raw, val_raw, {"input_size": size, "channels": channels})
+        export_models(model, out_path, args.export, class_names, calib_ds=val_ds)
+        return
+
+    # Build & train model with the created datasets
+    variant = parse_variant(args.variant or args.img_size)
+    train_ds, val_ds = variant_datasets(train_raw, val_raw, variant)
+    model = build_small_cnn(num_classes=num_classes, **variant)
+    model.fit(train_ds, validation_data=val_ds, epochs=args.epochs, callbacks=[StageCallback()])
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with stage("save"):
+        model.save(str(out_path))
 
     with open(str(out_path.with_suffix(".classes.json")), "w") as f:
         json.dump(class_names, f, indent=2)
@@ -108,5 +504,9 @@ def main():
     print(f"Saved model to {out_path}")
     print("Classes:", class_names)
 
+    # int8 calibration uses un-augmented crops
+    with stage("export"):
+        export_models(model, out_path, args.export, class_names, calib_ds=val_ds)
+
 if __name__ == "__main__":
     main()
@@ -4,10 +4,17 @@ Functions for ordering corners and warping a chessboard image to a top-down view
 Used in annotate_corners.py, infer_image.py, and build_dataset.py.
 Using the points from the corner annotation step, we compute a homography to warp
 the input image to a square top-down view of the chessboard.
+warp_squares samples the 64 square crops directly from the photo: one warpPerspective per square
+for new corners, a cached remap grid once the same corners come back (fixed camera, video).
+save_corners writes every corners JSON (annotate_corners.py, detect_corners.py) in one frame:
+ordered, full-resolution image pixels.
 """
 
+import json
 import cv2
 import numpy as np
+from functools import lru_cache
+from pathlib import Path
 
 # Order corners as Top Left, Top Right, Bottom Right, Bottom Left
 # Based on perspective of image, not chessboard orientation 
@@ -35,8 +42,23 @@ def order_corners(pts):
     bl = pts[np.argmax(diff)]
     # TL would have smallest sum, BR largest sum
     # TR would have smallest difference, BL largest difference
+    # A board turned ~45° in the photo can make two of these the same point; then walk the
+    # corners clockwise around their centre instead, starting from TL
+    if len({tuple(p) for p in (tl, tr, br, bl)}) < 4:
+        centre = pts.mean(axis=0)
+        clockwise = pts[np.argsort(np.arctan2(pts[:, 1] - centre[1], pts[:, 0] - centre[0]))]
+        start = int(np.argmin(clockwise.sum(axis=1)))
+        tl, tr, br, bl = np.roll(clockwise, -start, axis=0)
     return np.array([tl, tr, br, bl], dtype=np.float32)
 
+# Write 4 corners as ordered full-resolution image pixels; `scale` is the (display / full image)
+# scale the points were picked at, e.g. clicks on a reduced decode
+def save_corners(corners, out_path, scale=1.0):
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "w") as f:
+        json.dump(order_corners(np.asarray(corners, dtype=np.float32) / scale).tolist(), f, indent=2)
+
 # Warp the board to a top-down view using the given corners
 def warp_board(img_bgr, corners_xy, out_size=800):
     # takes corners as list or np array of (x,y) points
@@ -52,3 +74,72 @@ def warp_board(img_bgr, corners_xy, out_size=800):
     H = cv2.getPerspectiveTransform(corners_xy, dst)
     topdown = cv2.warpPerspective(img_bgr, H, (out_size, out_size))
     return topdown, H
+
+# Remap grid that samples the 64 padded square crops straight from the source image
+# Equivalent to warp_board(out_size) -> split_squares(pad) -> resize(img_size), but
+# only the img_size x img_size pixels of each crop are ever computed.
+# Cached by corners, so frames from a fixed camera reuse the same grid.
+@lru_cache(maxsize=32)
+def _square_remap(corners_key, img_size, pad, out_size):
+    corners_xy = order_corners(np.array(corners_key, dtype=np.float32).reshape(4, 2))
+    dst = np.float32([[0,0],[out_size-1,0],[out_size-1,out_size-1],[0,out_size-1]])
+    H = cv2.getPerspectiveTransform(corners_xy, dst)
+    H_inv = np.linalg.inv(H).astype(np.float32)
+    cell = out_size // 8
+    span = cell - 2*pad
+    # top-down coordinate of every output pixel (same pixel-centre convention as cv2.resize):
+    # rows run rank by rank, columns file by file, so one vector serves both axes
+    offs = pad + (np.arange(img_size) + 0.5) * span / img_size - 0.5
+    v = (np.arange(8)[:, None] * cell + offs).ravel().astype(np.float32)
+    # map top-down coords back to source pixels through the inverse homography; each of its
+    # rows is h0*x + h1*y + h2, so the (8*img_size)^2 grid is an outer sum, all in float32
+    src_x, src_y, w = [(h[1]*v + h[2])[:, None] + (h[0]*v)[None, :] for h in H_inv]
+    src_x /= w
+    src_y /= w
+    # (8 ranks, img_size rows, 8 files, img_size cols) -> 64 crops stacked vertically
+    def crops_layout(m):
+        return m.reshape(8, img_size, 8, img_size).transpose(0, 2, 1, 3).reshape(64 * img_size, img_size)
+    # fixed-point maps are faster to remap with
+    return cv2.convertMaps(crops_layout(src_x), crops_layout(src_y), cv2.CV_16SC2)
+
+# The same 64 crops with one warpPerspective per square: no grid to build, so this is the
+# fast path for corners seen once (batch inference over photos, jittered augmentation)
+def _warp_cells(img_bgr, corners_xy, img_size, pad, out_size):
+    dst = np.float32([[0,0],[out_size-1,0],[out_size-1,out_size-1],[0,out_size-1]])
+    H = cv2.getPerspectiveTransform(order_corners(corners_xy), dst)
+    cell = out_size // 8
+    k = (cell - 2*pad) / img_size
+    # top-down pixel -> crop pixel for each square: (p - origin) / k, with the crop origin at
+    # the same pixel-centre convention as cv2.resize
+    origin = np.arange(8) * cell + pad + 0.5*k - 0.5
+    to_crop = np.zeros((64, 3, 3))
+    to_crop[:, 0, 0] = to_crop[:, 1, 1] = 1.0 / k
+    to_crop[:, 0, 2] = -np.tile(origin, 8) / k
+    to_crop[:, 1, 2] = -np.repeat(origin, 8) / k
+    to_crop[:, 2, 2] = 1.0
+    crops = np.empty((64, img_size, img_size, *img_bgr.shape[2:]), dtype=np.uint8)
+    for crop, M in zip(crops, to_crop @ H):
+        cv2.warpPerspective(img_bgr, M, (img_size, img_size), dst=crop, flags=cv2.INTER_LINEAR)
+    return crops
+
+# Corners warped so far (oldest first); a remap grid is only built once the same corners come back
+_seen_corners = {}
+
+# Sample the 64 square crops (a8..h1 order, like split_squares) directly from the photo
+# returns uint8 (64, img_size, img_size, C)
+# cache=False never builds a grid, for one-off corners (e.g. jittered for augmentation)
+def warp_squares(img_bgr, corners_xy, img_size=96, pad=2, out_size=800, cache=True):
+    corners_xy = np.array(corners_xy, dtype=np.float32)
+    if corners_xy.shape != (4,2):
+        raise ValueError("corners_xy must be (4,2).")
+    key = (tuple(np.round(corners_xy, 2).ravel().tolist()), img_size, pad, out_size)
+    if not cache or key not in _seen_corners:
+        if cache:
+            _seen_corners[key] = None
+            if len(_seen_corners) > 256:
+                _seen_corners.pop(next(iter(_seen_corners)), None)
+        return _warp_cells(img_bgr, corners_xy, img_size, pad, out_size)
+    # fixed camera: the same corners again, remap with the cached grid
+    map1, map2 = _square_remap(*key)
+    crops = cv2.remap(img_bgr, map1, map2, cv2.INTER_LINEAR)
+    return crops.reshape(64, img_size, img_size, *img_bgr.shape[2:])